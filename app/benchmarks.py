@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import timeit
+import tracemalloc
+from typing import Callable
+
+import dictionary
+import game_turns
+from game_journal import GameJournal
+from game_options import GameOptions, Pace, InputMode
+import kana_conversion
+from game_state import GameState
+import played_words
+from played_words import PlayedWords
+from simulator import FakeUser, FakeChannel, FakeInteraction
+from team import Team
+
+KATAKANA_WORDS = ['シンブン', 'コーヒー', 'チョコレート', 'ジャンケン', 'アイスクリーム', 'ヴァイオリン', 'トウキョウ', 'ギュウニュウ']
+HIRAGANA_WORDS = ['しんぶん', 'こうひい', 'ちょこれいと', 'じゃんけん', 'とうきょう']
+ROMAJI_WORDS = ['sushi', 'koohii', 'konnichiwa', 'shinnen', 'kyouto', 'chotto', 'gakkou', 'onna', 'hannou', 'senpai']
+
+PATHOLOGICAL_ROMAJI = {
+    'long romaji': 'sayonara' * 8,
+    'many n': 'n' * 64,
+    'many na': 'na' * 32,
+    'many long vowels': 'ou' * 32,
+}
+PATHOLOGICAL_KATAKANA = {
+    'many choonpu': 'コ' + 'ー' * 63,
+    'many yoon': 'キャ' * 32,
+}
+
+MOCK_WORDS = {
+    'すし': '寿司', 'しか': '鹿', 'かし': '菓子', 'しんぶん': '新聞', 'こうひい': None, 'いす': '椅子', 'すいか': '西瓜',
+    'かさ': '傘', 'さかな': '魚', 'なす': '茄子', 'すな': '砂', 'ないふ': None, 'ふね': '船', 'ねこ': '猫',
+}
+
+
+class MockDictionary(dictionary.DictionaryBackend):
+    """
+    In memory dictionary of a few words, so benchmarks do not depend on the local dictionary or the network.
+    """
+
+    def __init__(self, words: dict[str, str | None]):
+        self.words = {kana_conversion.dictionary_key(reading): {reading: [{'word': word, 'meanings': [reading],
+                                                                           'reading': reading}]}
+                      for reading, word in words.items()}
+
+    def search(self, term: str) -> dict:
+        if term.endswith('*'):
+            key = kana_conversion.dictionary_key(term[:-1])
+            return {r: w for k, words in self.words.items() if k.startswith(key) for r, w in words.items()}
+        return self.words.get(kana_conversion.dictionary_key(term), {})
+
+
+def benchmark(func: Callable[[], object], number: int = 1000, repeat: int = 5) -> dict[str, float]:
+    """
+    Time a function over several runs.
+
+    :param func: Function to time
+    :param number: Number of calls per run
+    :param repeat: Number of runs
+    :return: Dictionary of the minimum, mean and standard deviation of the time per call in microseconds
+    """
+    times = [t / number * 1e6 for t in timeit.repeat(func, number=number, repeat=repeat)]
+    return {'min': min(times), 'mean': statistics.mean(times), 'stdev': statistics.stdev(times)}
+
+
+def uncached(conversion: Callable[[str], object], words: list[str]) -> Callable[[], None]:
+    """
+    Wrap a memoized conversion so its memo is cleared before every call, to time the conversion itself.
+
+    :param conversion: Memoized conversion
+    :param words: Words to convert
+    :return: Function converting every word
+    """
+    def convert():
+        for w in words:
+            conversion.cache_clear()
+            conversion(w)
+    return convert
+
+
+def conversion_benchmarks() -> dict[str, dict[str, float]]:
+    """
+    Time the kana conversions over realistic words and pathological inputs.
+
+    :return: Dictionary of benchmark names and timings per pass over the words
+    """
+    results = {
+        'normalise_katakana': benchmark(uncached(kana_conversion.normalise_katakana, KATAKANA_WORDS)),
+        'normalise_katakana (memo)': benchmark(lambda: [kana_conversion.normalise_katakana(w) for w in KATAKANA_WORDS]),
+        'katakana_to_hiragana': benchmark(uncached(kana_conversion.katakana_to_hiragana, KATAKANA_WORDS)),
+        'hiragana_to_katakana': benchmark(uncached(kana_conversion.hiragana_to_katakana, HIRAGANA_WORDS)),
+        'kana_to_romaji': benchmark(uncached(kana_conversion.kana_to_romaji, KATAKANA_WORDS)),
+        'is_kana': benchmark(lambda: [kana_conversion.is_kana(w) for w in KATAKANA_WORDS]),
+        'romaji_to_hira_kata': benchmark(lambda: [kana_conversion.romaji_to_hira_kata(w) for w in ROMAJI_WORDS]),
+    }
+    for name, romaji in PATHOLOGICAL_ROMAJI.items():
+        results[f"romaji_to_hira_kata ({name})"] = benchmark(lambda: kana_conversion.romaji_to_hira_kata(romaji),
+                                                             number=100)
+    for name, kata in PATHOLOGICAL_KATAKANA.items():
+        results[f"normalise_katakana ({name})"] = benchmark(uncached(kana_conversion.normalise_katakana, [kata]))
+        results[f"kana_to_romaji ({name})"] = benchmark(uncached(kana_conversion.kana_to_romaji, [kata]))
+    return results
+
+
+def matching_benchmarks() -> dict[str, dict[str, float]]:
+    """
+    Time checking that words follow each other, by matching whole words and by comparing the cached last mora of the
+    previous word with the first mora of the next. The words are normalised once before timing, as the game keeps the
+    last mora of the previous word.
+
+    :return: Dictionary of benchmark names and timings per pass over the pairs
+    """
+    pairs = list(zip(KATAKANA_WORDS, KATAKANA_WORDS[1:])) + [('シャシン', 'シャカイ'), ('イシャ', 'ヤマ')]
+    long_pair = ('キ' * 64, 'カ' * 64)
+    ends = {kata: kana_conversion.end_mora(kata) for pair in pairs + [long_pair] for kata in pair}
+    return {
+        'match_kana': benchmark(lambda: [kana_conversion.match_kana(a, b) for a, b in pairs]),
+        'match_mora': benchmark(
+            lambda: [kana_conversion.match_mora(ends[a], kana_conversion.start_mora(b)) for a, b in pairs]),
+        'match_kana (long words)': benchmark(lambda: kana_conversion.match_kana(*long_pair)),
+        'match_mora (long words)': benchmark(
+            lambda: kana_conversion.match_mora(ends[long_pair[0]], kana_conversion.start_mora(long_pair[1]))),
+    }
+
+
+def game_state_benchmarks() -> dict[str, dict[str, float]]:
+    """
+    Time validating words against a game state with a long streak.
+
+    :return: Dictionary of benchmark names and timings per pass over the words
+    """
+    game_state = GameState([Team([FakeUser(1)]), Team([FakeUser(2)])])
+    game_state.set_previous_word('スシ', '寿司')
+    game_state.played_words = PlayedWords(f"シ{i}" for i in range(500))
+    candidates = ['シカ', 'シンブン', 'カシ', 'シ', 'シャシン', 'ジカン']
+    return {'get_invalid_reasons': benchmark(lambda: [game_state.get_invalid_reasons(k) for k in candidates])}
+
+
+def turn_benchmarks() -> dict[str, dict[str, float]]:
+    """
+    Time processing player answers against the mock dictionary, with the lookup cache warm.
+
+    :return: Dictionary of benchmark names and timings per answer
+    """
+    kana_conversion.dictionary_backend = MockDictionary(MOCK_WORDS)
+    kana_conversion.lookup_cache.clear()
+    inter = FakeInteraction(FakeChannel())
+    loop = asyncio.new_event_loop()
+
+    def process(processor: Callable, answers: list[str]) -> Callable[[], None]:
+        async def run():
+            for answer in answers:
+                game_state = GameState([Team([FakeUser(1)])])
+                game_state.set_previous_word('スシ', '寿司')
+                await processor(inter, answer, game_state)
+        return lambda: loop.run_until_complete(run())
+
+    results = {
+        'process_player_romaji': benchmark(process(game_turns.process_player_romaji, ['shika', 'shinbun', 'shio']),
+                                           number=200),
+        'process_player_kana': benchmark(process(game_turns.process_player_kana, ['しか', 'しんぶん', 'しお']),
+                                         number=200),
+    }
+    loop.close()
+    return results
+
+
+def measure_memory(build: Callable[[], object], number: int) -> float:
+    """
+    Measure the memory kept alive by objects.
+
+    :param build: Function building one object
+    :param number: Number of objects to build
+    :return: Memory per object in kilobytes
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build() for _ in range(number)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return size / number / 1024
+
+
+def memory_benchmarks(num_games: int = 100, streak: int = 1000, vocabulary_size: int = 20000) -> dict[str, float]:
+    """
+    Measure the memory per game of the words played in long streaks, with every game drawing its words from the same
+    vocabulary. Every word is copied, as the words of a real game come from separate messages.
+
+    :param num_games: Number of games
+    :param streak: Number of words played in each game
+    :param vocabulary_size: Number of distinct words played across games
+    :return: Dictionary of benchmark names and kilobytes per game
+    """
+    rng = random.Random(0)
+    katakana = [chr(c) for c in range(ord('ア'), ord('ン') + 1)]
+    vocabulary = list({''.join(rng.choices(katakana, k=rng.randint(2, 6))) for _ in range(vocabulary_size)})
+    streaks = [rng.sample(vocabulary, streak) for _ in range(num_games)]
+    players = [FakeUser(1), FakeUser(2)]
+
+    def copies() -> list[str]:
+        return [''.join(list(kata)) for kata in streaks[rng.randrange(num_games)]]
+
+    def game_state(journal: GameJournal = None) -> GameState:
+        state = GameState([Team([player]) for player in players])
+        if journal:
+            journal.start(state, 0, None, 0, GameOptions(Pace.NORMAL, InputMode.ROMAJI, False))
+        for i, kata in enumerate(copies()):
+            state.play_word(kata, kata, players[i % 2])
+        return state
+
+    # The table of words shared by every game is measured on its own, as it is only paid once per process
+    shared_table = measure_memory(lambda: [played_words.intern_word(kata) for kata in vocabulary], 1) / num_games
+    results = {
+        f"shared word table ({len(vocabulary)} words, per game)": shared_table,
+        f"played words as set of strings ({streak} words)": measure_memory(lambda: set(copies()), num_games),
+        f"played words ({streak} words)": measure_memory(lambda: PlayedWords(copies()), num_games),
+        f"game state ({streak} words)": measure_memory(game_state, num_games),
+    }
+    # Journalled games also count what the journal keeps for them, which is written to a file that is never compacted
+    with tempfile.TemporaryDirectory() as directory:
+        journal = GameJournal(f"{directory}/journal", compact_size=1 << 40)
+        results[f"journalled game state ({streak} words)"] = measure_memory(lambda: game_state(journal), num_games)
+        journal.file.close()
+    return results
+
+
+def run_benchmarks() -> dict:
+    """
+    Run every benchmark.
+
+    :return: Machine readable results, with the environment they were measured in
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': {**conversion_benchmarks(), **matching_benchmarks(), **game_state_benchmarks(), **turn_benchmarks()},
+        'memory_kb': memory_benchmarks(),
+    }
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """
+    Print the change in mean time of every benchmark between two runs.
+
+    :param baseline: Results of the baseline run
+    :param current: Results of the current run
+    :return:
+    """
+    print(f"Comparing {baseline['commit'][:10] or 'baseline'} with {current['commit'][:10] or 'current'}")
+    for name, timing in current['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:48s} {timing['mean']:10.2f} us")
+            continue
+        before = baseline['results'][name]['mean']
+        print(f"{name:48s} {before:10.2f} us -> {timing['mean']:10.2f} us ({timing['mean'] / before:.2f}x)")
+    for name, size in current.get('memory_kb', {}).items():
+        before = baseline.get('memory_kb', {}).get(name)
+        print(f"{name:48s} " + (f"{before:10.2f} KB -> " if before else "") + f"{size:10.2f} KB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the kana conversion and validation hot paths")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare the results with a JSON file from an earlier run")
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmarks()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(benchmark_results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), benchmark_results)
+    else:
+        for benchmark_name, timing in benchmark_results['results'].items():
+            print(f"{benchmark_name:48s} {timing['mean']:10.2f} us ± {timing['stdev']:.2f}")
+        for benchmark_name, size in benchmark_results['memory_kb'].items():
+            print(f"{benchmark_name:48s} {size:10.2f} KB per game")
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import kana_conversion
+from constants import BOT_SEARCH_WORKERS
+from dictionary import MoveCounter
+
+logger = logging.getLogger("shiritori-ref")
+
+# Score of a position the player to move has lost, larger than any count of continuations
+LOST = 1 << 30
+EXACT, LOWER, UPPER = range(3)
+
+# Searches get their own threads, so a slow search never holds up dictionary lookups
+search_executor = ThreadPoolExecutor(max_workers=BOT_SEARCH_WORKERS, thread_name_prefix="bot-search")
+
+
+class SearchTimeout(Exception):
+    """
+    Raised when a search runs out of time.
+    """
+
+
+class GameTreeSearch:
+    """
+    Negamax search with alpha-beta pruning over the moves of the mora graph. Words with the same first and last mora
+    lead to the same position, so a move is a pair of moras rather than a word, and a position is the mora to play
+    from with the edges played so far. Positions are memoised by their mora and a fingerprint of the edges played
+    during the search. The player to move loses when no unplayed word starts with their mora, and positions at the
+    depth limit are scored by how many unplayed words start with their mora.
+    """
+
+    def __init__(self, move_counter: MoveCounter, time_limit: float, max_depth: int):
+        self.counter = move_counter
+        self.graph = move_counter.graph
+        self.deadline = time.perf_counter() + time_limit
+        self.max_depth = max_depth
+        # Edges and first moras played during the search, on top of those played in the game
+        self.played: dict[tuple[int, int], int] = {}
+        self.played_from: dict[int, int] = {}
+        self.memo: dict[tuple[int, int, frozenset], tuple[int, int]] = {}
+        self.nodes_searched = 0
+
+    def remaining(self, first: int, last: int = None) -> int:
+        """
+        Count the unplayed words from a mora, or between two moras.
+
+        :param first: Node of the first mora
+        :param last: Node of the last mora, or None to count the words to every mora
+        :return: Number of unplayed words
+        """
+        if last is None:
+            return (self.graph.totals[first] - self.counter.played_from.get(first, 0)
+                    - self.played_from.get(first, 0))
+        begin, end = self.graph.slices[first, last]
+        return end - begin - self.counter.played.get((first, last), 0) - self.played.get((first, last), 0)
+
+    def moves(self, first: int) -> list[int]:
+        """
+        Get the moras that can be reached from a mora, ordered so the moras with the fewest continuations come first.
+
+        :param first: Node of the first mora
+        :return: Nodes of the last moras
+        """
+        moves = [last for last, _, _ in self.graph.edges.get(first, []) if self.remaining(first, last) > 0]
+        return sorted(moves, key=self.remaining)
+
+    def play(self, first: int, last: int, count: int) -> None:
+        edge = (first, last)
+        self.played[edge] = self.played.get(edge, 0) + count
+        self.played_from[first] = self.played_from.get(first, 0) + count
+
+    def negamax(self, first: int, depth: int, alpha: int, beta: int) -> int:
+        """
+        Score a position for the player to move.
+
+        :param first: Node of the mora to play from
+        :param depth: Number of moves to look ahead
+        :param alpha: Lowest score the player to move is already guaranteed
+        :param beta: Highest score the opponent allows
+        :return: Score of the position
+        """
+        self.nodes_searched += 1
+        if depth == 0:
+            return self.remaining(first) or -LOST
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        moves = self.moves(first)
+        if not moves:
+            # Losing later is better than losing sooner
+            return -LOST - depth
+
+        key = (first, depth, frozenset((edge, count) for edge, count in self.played.items() if count))
+        if key in self.memo:
+            flag, score = self.memo[key]
+            if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                return score
+
+        original_alpha = alpha
+        best = -LOST - self.max_depth - 1
+        for last in moves:
+            self.play(first, last, 1)
+            try:
+                score = -self.negamax(last, depth - 1, -beta, -alpha)
+            finally:
+                self.play(first, last, -1)
+            best = max(best, score)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        self.memo[key] = (UPPER if best <= original_alpha else LOWER if best >= beta else EXACT, best)
+        return best
+
+    def search(self, mora: str) -> int | None:
+        """
+        Find the best mora to play to, deepening the search until the time limit or the maximum depth is reached. The
+        first depth only counts the continuations of each move and is never timed out, so a move is always found.
+
+        :param mora: Normalised mora to play from
+        :return: Node of the last mora of the best move, or None if no unplayed word starts with the mora
+        """
+        self.counter.update()
+        first = self.graph.nodes.get(mora)
+        moves = self.moves(first) if first is not None else []
+        if not moves:
+            return None
+
+        best = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            # Scores of moves after the first are only bounds, which is enough to tell they are no better
+            scores = {}
+            alpha = -LOST * 2
+            try:
+                for last in moves:
+                    self.play(first, last, 1)
+                    try:
+                        scores[last] = -self.negamax(last, depth - 1, -LOST * 2, -alpha)
+                    finally:
+                        self.play(first, last, -1)
+                    alpha = max(alpha, scores[last])
+            except SearchTimeout:
+                break
+            # Search the best move first at the next depth
+            moves.sort(key=lambda node: -scores[node])
+            best = moves[0]
+            logger.debug("Searched depth %d from %s: %s scores %d", depth, mora, self.graph.moras[best], scores[best])
+            if abs(scores[best]) >= LOST:
+                break
+        return best
+
+
+def find_move(move_counter: MoveCounter, mora: str, time_limit: float, max_depth: int) -> str:
+    """
+    Search for the word to play from a mora that leaves the opponent the fewest continuations. This is CPU bound, so
+    it should be run in an executor.
+
+    :param move_counter: Move counter of the game
+    :param mora: Normalised mora to play from
+    :param time_limit: Time in seconds to search for
+    :param max_depth: Maximum number of moves to look ahead
+    :return: Reading of the word, or an empty string if no unplayed word starts with the mora
+    """
+    search = GameTreeSearch(move_counter, time_limit, max_depth)
+    last = search.search(mora)
+    if last is None:
+        return ""
+    logger.info("Searched %d positions, playing %s to %s", search.nodes_searched, mora, move_counter.graph.moras[last],
+                extra={'positions': search.nodes_searched})
+    return move_counter.pick(move_counter.graph.nodes[mora], last)
+
+
+async def search_move(move_counter: MoveCounter, word: str, time_limit: float, max_depth: int) -> str:
+    """
+    Search for the word to play after a word in the search executor, so the search does not block the event loop.
+
+    :param move_counter: Move counter of the game
+    :param word: Katakana of the previous word
+    :param time_limit: Time in seconds to search for
+    :param max_depth: Maximum number of moves to look ahead
+    :return: Reading of the word, or an empty string if no unplayed word starts with the last mora of the word
+    """
+    mora = kana_conversion.normalise_katakana(word)[-1]
+    return await asyncio.get_running_loop().run_in_executor(search_executor, find_move, move_counter, mora,
+                                                            time_limit, max_depth)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+
+import kana_conversion
+from constants import WARM_UP, WARM_UP_CONCURRENCY
+
+logger = logging.getLogger("shiritori-ref")
+
+
+class CacheWarmUp:
+    """
+    Loads the dictionary indexes after startup and, when searches go over the network, fetches the words starting with
+    every mora into the lookup cache, so the first game reaching each mora does not wait for a cold lookup. A local
+    dictionary picks moves from its indexes, so only they are loaded. The bot is not ready until the warm up has
+    finished, which commands starting games can check to turn players away rather than start a slow game.
+    """
+
+    def __init__(self, enabled: bool = WARM_UP, max_concurrent: int = WARM_UP_CONCURRENCY):
+        self.enabled = enabled
+        self.max_concurrent = max_concurrent
+        self.ready = not enabled
+        self.task = None
+
+    def start(self) -> None:
+        """
+        Start warming up in the background, unless it is disabled or already started.
+
+        :return:
+        """
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        """
+        Warm up the caches, fetching the words of at most max_concurrent moras at once. Moras that fail to load are
+        logged and skipped, and the bot is ready once every mora has been tried, so a failing dictionary never keeps
+        games from starting.
+
+        :return:
+        """
+        start = time.perf_counter()
+        moras = sorted(kana_conversion.set_mora)
+        step = max(1, len(moras) // 10)
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        done = 0
+        failed = 0
+
+        async def warm_up(mora: str) -> None:
+            nonlocal done, failed
+            async with semaphore:
+                try:
+                    await kana_conversion.prefetch_words_starting_with(mora)
+                except Exception as e:
+                    failed += 1
+                    logger.warning("Could not warm up the words starting with %s: %s", mora, e)
+            done += 1
+            if done % step == 0 or done == len(moras):
+                logger.info("Warmed up %d of %d moras", done, len(moras), extra={'done': done, 'total': len(moras)})
+
+        try:
+            await kana_conversion.load_indexes()
+            if kana_conversion.get_dictionary_backend().is_remote():
+                await asyncio.gather(*[warm_up(mora) for mora in moras])
+        except Exception as e:
+            logger.warning("Could not warm up the dictionary: %s", e)
+        finally:
+            self.ready = True
+        elapsed = time.perf_counter() - start
+        logger.info("Warmed up in %.1fs, %d moras failed", elapsed, failed,
+                    extra={'seconds': elapsed, 'failed': failed})
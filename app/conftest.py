@@ -0,0 +1,38 @@
+import pytest
+
+import dictionary
+
+# Entries of a tiny JMdict dump, as the kanji spellings, readings and English meaning of each entry
+ENTRIES = [
+    (["引っ越し"], ["ひっこし"], "moving"),
+    (["大きい"], ["おおきい"], "big"),
+    (["猫"], ["ねこ"], "cat"),
+    (["葡萄"], ["ぶどう"], "grape"),
+    ([], ["しりとり"], "shiritori"),
+]
+
+
+def jmdict(entries: list[tuple[list[str], list[str], str]]) -> str:
+    """
+    Write entries in the JMdict XML format.
+
+    :param entries: Kanji spellings, readings and meaning of each entry
+    :return: JMdict XML
+    """
+    xml = []
+    for entry_id, (kanji, readings, meaning) in enumerate(entries, 1):
+        xml.append(f"<entry><ent_seq>{entry_id}</ent_seq>"
+                   + "".join(f"<k_ele><keb>{k}</keb></k_ele>" for k in kanji)
+                   + "".join(f"<r_ele><reb>{r}</reb></r_ele>" for r in readings)
+                   + f"<sense><gloss>{meaning}</gloss></sense></entry>")
+    return f"<JMdict>{''.join(xml)}</JMdict>"
+
+
+@pytest.fixture(scope="module")
+def local_dictionary(tmp_path_factory) -> dictionary.LocalDictionary:
+    tmp_path = tmp_path_factory.mktemp("dictionary")
+    source = tmp_path / "JMdict.xml"
+    source.write_text(jmdict(ENTRIES), encoding="utf-8")
+    path = str(tmp_path / "dictionary.sqlite")
+    dictionary.build_local_dictionary(str(source), path)
+    return dictionary.LocalDictionary(path)
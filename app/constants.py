@@ -1,3 +1,9 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
 GUILDS = [643165990695206920, 931645765980393624]
 
 DUEL_TIMEOUT = 180
@@ -5,3 +11,44 @@ MESSAGE_BEGIN = ["> ", "、"]
 TIME_NORMAL = 60
 TIME_SPEED = 15
 END_DUEL = "> end"
+MAX_ROMAJI_LENGTH = 64
+MAX_ROMAJI_VARIANTS = 16
+
+DICTIONARY_PATH = os.getenv("DICTIONARY_PATH", "jmdict.sqlite")
+JISHO_FALLBACK = os.getenv("JISHO_FALLBACK", "false").lower() == "true"
+DICTIONARY_WORKERS = int(os.getenv("DICTIONARY_WORKERS", "8"))
+JISHO_CONCURRENCY = int(os.getenv("JISHO_CONCURRENCY", "4"))
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "86400"))
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "600"))
+CACHE_PATH = os.getenv("CACHE_PATH", "lookup_cache.sqlite")
+CACHE_PERSISTENT_TTL = float(os.getenv("CACHE_PERSISTENT_TTL", str(30 * 86400)))
+CACHE_COMPACT_INTERVAL = float(os.getenv("CACHE_COMPACT_INTERVAL", "3600"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+MAX_GAMES_PER_CHANNEL = int(os.getenv("MAX_GAMES_PER_CHANNEL", "1"))
+MAX_GAMES_PER_GUILD = int(os.getenv("MAX_GAMES_PER_GUILD", "20"))
+MAX_GAMES = int(os.getenv("MAX_GAMES", "500"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard] or None
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "shared_state.sqlite")
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "games.journal")
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "false").lower() == "true"
+BOT_SEARCH_TIME = float(os.getenv("BOT_SEARCH_TIME", "1.0"))
+BOT_SEARCH_DEPTH = int(os.getenv("BOT_SEARCH_DEPTH", "8"))
+BOT_SEARCH_WORKERS = int(os.getenv("BOT_SEARCH_WORKERS", "2"))
+MESSAGE_LIMIT = 2000
+CHANNEL_RATE_LIMIT = int(os.getenv("CHANNEL_RATE_LIMIT", "5"))
+CHANNEL_RATE_PERIOD = float(os.getenv("CHANNEL_RATE_PERIOD", "5"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "0"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_STRUCTURED = os.getenv("LOG_STRUCTURED", "false").lower() == "true"
+LOG_SAMPLE = int(os.getenv("LOG_SAMPLE", "100"))
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_READINGS = int(os.getenv("PREFETCH_READINGS", "5"))
+PREFETCH_FOLLOW_UPS = int(os.getenv("PREFETCH_FOLLOW_UPS", "3"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+WARM_UP = os.getenv("WARM_UP", "false").lower() == "true"
+WARM_UP_CONCURRENCY = int(os.getenv("WARM_UP_CONCURRENCY", "4"))
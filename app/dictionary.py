@@ -0,0 +1,664 @@
+import argparse
+import gzip
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from abc import ABC, abstractmethod
+from array import array
+from typing import Iterator
+
+import kana_conversion
+from constants import (DICTIONARY_PATH, JISHO_FALLBACK, JISHO_CONCURRENCY, CACHE_PATH, CACHE_PERSISTENT_TTL,
+                       CACHE_NEGATIVE_TTL, CACHE_COMPACT_INTERVAL)
+from played_words import PlayedWords
+
+logger = logging.getLogger("shiritori-ref")
+
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    meanings TEXT NOT NULL,
+    common INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forms (
+    entry INTEGER NOT NULL REFERENCES entries(id),
+    word TEXT,
+    reading TEXT NOT NULL,
+    reading_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS forms_reading_key ON forms(reading_key);
+CREATE INDEX IF NOT EXISTS forms_word ON forms(word);
+CREATE INDEX IF NOT EXISTS forms_entry ON forms(entry);
+CREATE TABLE IF NOT EXISTS moves (
+    form INTEGER PRIMARY KEY,
+    first_mora TEXT NOT NULL,
+    last_mora TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS romaji (
+    form INTEGER PRIMARY KEY,
+    romaji TEXT NOT NULL,
+    romaji_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS romaji_key ON romaji(romaji_key);
+CREATE TABLE IF NOT EXISTS spellings (
+    form INTEGER PRIMARY KEY,
+    spelling_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spelling_key ON spellings(spelling_key);
+"""
+
+CACHE_SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS lookups (
+    term TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    words TEXT NOT NULL
+);
+"""
+
+
+class DictionaryBackend(ABC):
+    """
+    A source of dictionary entries. Every backend returns results in the same shape as the Jisho search: a dictionary
+    with keys as readings and values a list of dictionaries with keys: word, meanings, reading.
+    """
+
+    @abstractmethod
+    def search(self, term: str) -> dict:
+        """
+        Searches the dictionary for a term. A term ending in * is a search for readings starting with the term.
+
+        :param term: Search term
+        :return: A dictionary with keys as readings and values a list of word information dictionaries
+        """
+
+    def has_prefix(self, prefix: str) -> bool:
+        """
+        Checks if any reading in the dictionary starts with the prefix. Backends that cannot check cheaply assume so.
+
+        :param prefix: Kana prefix
+        :return: Whether a reading could start with the prefix
+        """
+        return True
+
+    def is_remote(self) -> bool:
+        """
+        Checks if searches go over the network, making them slow enough to be worth prefetching.
+
+        :return: Whether searches are remote
+        """
+        return False
+
+    def search_romaji(self, romaji: str) -> dict | None:
+        """
+        Searches the dictionary for readings written the same in romaji, ignoring long vowels. Backends without a romaji
+        index return None, and romaji is then searched through its kana parsings instead.
+
+        :param romaji: Romaji search term
+        :return: A dictionary with keys as the romaji of the readings and values a list of word information
+        dictionaries, or None if the backend has no romaji index
+        """
+        return None
+
+    def search_word(self, word: str) -> dict | None:
+        """
+        Searches the dictionary for the readings of a written word, or of a word only written in kana. Spellings
+        differing only in okurigana, such as 引越し and 引っ越し, are found if the exact spelling is not, as long as
+        the okurigana fit the reading. Backends without a spelling index return None, and the word is then found with
+        search instead.
+
+        :param word: Written word, usually in kanji
+        :return: A dictionary with keys as the readings of the word and values a list of word information dictionaries
+        of that spelling, or None if the backend has no spelling index
+        """
+        return None
+
+    def mora_index(self) -> "MoraIndex | None":
+        """
+        Get the starting mora index of the dictionary, if it has one.
+
+        :return: The starting mora index, or None if the backend cannot be indexed
+        """
+        return None
+
+    def mora_graph(self) -> "MoraGraph | None":
+        """
+        Get the mora graph of the dictionary, if it has one.
+
+        :return: The mora graph, or None if the backend cannot be indexed
+        """
+        return None
+
+
+class JishoBackend(DictionaryBackend):
+    """
+    Looks up words with the Jisho API. Requires the optional jisho_api package and network access. Requests are
+    blocking, so at most max_requests are made at once to stay within Jisho's rate limits.
+    """
+
+    def __init__(self, max_requests: int = JISHO_CONCURRENCY):
+        from jisho_api.word import Word
+        self.word = Word
+        self.requests = threading.BoundedSemaphore(max_requests)
+
+    def search(self, term: str) -> dict:
+        with self.requests:
+            wr = self.word.request(term)
+        if not wr:
+            return {}
+        words = {}
+        for x in wr.dict()['data']:
+            for y in x['japanese']:
+                reading = y['reading']
+                if not reading or len(reading) <= 1:
+                    continue
+                word_info = {'word': y['word'],
+                             'meanings': [sense['english_definitions'][0] for sense in x['senses']],
+                             'reading': reading
+                             }
+
+                if reading in words:
+                    words[reading].append(word_info)
+                else:
+                    words[reading] = [word_info]
+        return words
+
+    def is_remote(self) -> bool:
+        return True
+
+
+class LocalDictionary(DictionaryBackend):
+    """
+    Looks up words in a local SQLite dictionary built with build_local_dictionary. Readings are indexed by
+    kana_conversion.dictionary_key, so hiragana, katakana and long vowel spellings of a reading all match. Each thread
+    gets its own read-only connection, so searches can run concurrently in an executor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.index = None
+        self.graph = None
+        self.index_lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, "connection"):
+            self.local.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return self.local.connection
+
+    def search(self, term: str) -> dict:
+        if term.endswith('*'):
+            key = kana_conversion.dictionary_key(term[:-1])
+            if not key:
+                return {}
+            rows = self.connection.execute(
+                "SELECT f.word, f.reading, e.meanings FROM forms f JOIN entries e ON e.id = f.entry "
+                "WHERE f.reading_key >= ? AND f.reading_key < ? ORDER BY e.common DESC, f.rowid",
+                (key, key + '\uffff'))
+        else:
+            key = kana_conversion.dictionary_key(term)
+            rows = self.connection.execute(
+                "SELECT f.word, f.reading, e.meanings FROM forms f JOIN entries e ON e.id = f.entry "
+                "WHERE f.entry IN (SELECT entry FROM forms WHERE reading_key = ? OR word = ?) "
+                "ORDER BY e.common DESC, f.rowid",
+                (key, term))
+
+        words = {}
+        for word, reading, meanings in rows:
+            word_info = {'word': word, 'meanings': json.loads(meanings), 'reading': reading}
+            if reading in words:
+                words[reading].append(word_info)
+            else:
+                words[reading] = [word_info]
+        return words
+
+    def has_prefix(self, prefix: str) -> bool:
+        key = kana_conversion.dictionary_key(prefix)
+        return self.connection.execute("SELECT 1 FROM forms WHERE reading_key >= ? AND reading_key < ? LIMIT 1",
+                                       (key, key + '\uffff')).fetchone() is not None
+
+    def search_romaji(self, romaji: str) -> dict | None:
+        try:
+            rows = self.connection.execute(
+                "SELECT r.romaji, f.word, f.reading, e.meanings FROM romaji r JOIN forms f ON f.rowid = r.form "
+                "JOIN entries e ON e.id = f.entry WHERE r.romaji_key = ? ORDER BY e.common DESC, f.rowid",
+                (kana_conversion.romaji_key(romaji),)).fetchall()
+        except sqlite3.OperationalError:
+            # Dictionaries built before the romaji index was added
+            return None
+
+        words = {}
+        for romaji, word, reading, meanings in rows:
+            words.setdefault(romaji, []).append({'word': word, 'meanings': json.loads(meanings), 'reading': reading})
+        return words
+
+    def search_word(self, word: str) -> dict | None:
+        query = ("SELECT f.word, f.reading, e.meanings FROM forms f JOIN entries e ON e.id = f.entry "
+                 "WHERE {} ORDER BY e.common DESC, f.rowid")
+        rows = self.connection.execute(
+            query.format("f.word = ? OR (f.reading_key = ? AND f.word IS NULL AND f.reading = ?)"),
+            (word, kana_conversion.dictionary_key(word), word)).fetchall()
+        key = kana_conversion.spelling_key(word)
+        if not rows and key:
+            try:
+                rows = self.connection.execute(query.format(
+                    "f.rowid IN (SELECT form FROM spellings WHERE spelling_key = ?)"), (key,)).fetchall()
+            except sqlite3.OperationalError:
+                # Dictionaries built before the spelling index was added
+                return None
+            # The key drops every kana, so only keep readings the kana of the word fit into
+            rows = [row for row in rows if kana_conversion.matches_okurigana(word, row[1])]
+
+        words = {}
+        for word, reading, meanings in rows:
+            words.setdefault(reading, []).append({'word': word, 'meanings': json.loads(meanings), 'reading': reading})
+        return words
+
+    def mora_index(self) -> "MoraIndex":
+        with self.index_lock:
+            if self.index is None:
+                self.index = MoraIndex(self)
+            return self.index
+
+    def mora_graph(self) -> "MoraGraph":
+        with self.index_lock:
+            if self.graph is None:
+                self.graph = MoraGraph(self)
+            return self.graph
+
+    def reading(self, word_id: int) -> str:
+        """
+        Get the reading of a word by its id.
+
+        :param word_id: Id of the word
+        :return: Reading of the word
+        """
+        return self.connection.execute("SELECT reading FROM forms WHERE rowid = ?", (word_id,)).fetchone()[0]
+
+
+def playable_moves(connection: sqlite3.Connection) -> Iterator[tuple[int, str, str]]:
+    """
+    Find the playable readings of a local dictionary, with their normalised first and last mora. Readings ending in ン
+    and readings of a single mora are left out, and each reading is only given once, with the id of its first form.
+
+    :param connection: Connection to the local dictionary
+    :return: Iterator of form ids, first mora and last mora
+    """
+    seen = set()
+    for word_id, reading in connection.execute("SELECT rowid, reading FROM forms ORDER BY rowid"):
+        kata = kana_conversion.hiragana_to_katakana(reading)
+        if reading in seen or kata[-1] == 'ン' or kata in kana_conversion.set_mora:
+            continue
+        seen.add(reading)
+        mora = kana_conversion.normalise_katakana(kata)
+        yield word_id, mora[0], mora[-1]
+
+
+def romaji_forms(connection: sqlite3.Connection) -> Iterator[tuple[int, str, str]]:
+    """
+    Find the romaji of every form of a local dictionary, and its key with long vowels removed.
+
+    :param connection: Connection to the local dictionary
+    :return: Iterator of form ids, romaji and romaji keys
+    """
+    for form_id, reading in connection.execute("SELECT rowid, reading FROM forms ORDER BY rowid"):
+        romaji = kana_conversion.kana_to_romaji(reading)
+        yield form_id, romaji, kana_conversion.romaji_key(romaji)
+
+
+def build_indexes(connection: sqlite3.Connection) -> None:
+    """
+    Fill the tables of a local dictionary derived from its forms: the moves of the mora graph, the romaji index and
+    the spelling index.
+
+    :param connection: Connection to the local dictionary
+    :return:
+    """
+    connection.executemany("INSERT INTO moves VALUES (?, ?, ?)", list(playable_moves(connection)))
+    connection.executemany("INSERT INTO romaji VALUES (?, ?, ?)", list(romaji_forms(connection)))
+    connection.executemany("INSERT INTO spellings VALUES (?, ?)",
+                           [(form_id, kana_conversion.spelling_key(word)) for form_id, word in
+                            connection.execute("SELECT rowid, word FROM forms WHERE word IS NOT NULL ORDER BY rowid")])
+
+
+class MoraIndex:
+    """
+    Index from normalised starting mora to the ids of every playable reading in a local dictionary, so the bot can pick
+    a word without searching. The index is loaded from the moves table written by build_local_dictionary, which leaves
+    out readings ending in ン and readings of a single mora.
+    """
+
+    def __init__(self, dictionary: LocalDictionary):
+        self.dictionary = dictionary
+        self.words: dict[str, array] = {}
+        start = time.monotonic()
+        try:
+            moves = dictionary.connection.execute("SELECT form, first_mora FROM moves ORDER BY form").fetchall()
+        except sqlite3.OperationalError:
+            logger.warning(f"Local dictionary {dictionary.path} has no moves table, rebuild it to load faster")
+            moves = [(word_id, first_mora) for word_id, first_mora, _ in playable_moves(dictionary.connection)]
+        for word_id, first_mora in moves:
+            self.words.setdefault(first_mora, array('I')).append(word_id)
+        logger.info(f"Loaded starting mora index of {len(moves)} words in {time.monotonic() - start:.2f}s")
+
+    def random_unplayed(self, mora: str, played_words: PlayedWords, attempts: int = 8) -> str:
+        """
+        Pick a random reading starting with the mora that has not been played yet. A few random picks are tried before
+        falling back to scanning every candidate, so this is constant time until the mora is almost exhausted.
+
+        :param mora: Normalised starting mora
+        :param played_words: Katakana of the words already played
+        :param attempts: Number of random picks to try before scanning
+        :return: Reading of the word, or an empty string if every word starting with the mora has been played
+        """
+        candidates = self.words.get(mora)
+        if not candidates:
+            return ""
+        for _ in range(attempts):
+            reading = self.dictionary.reading(random.choice(candidates))
+            if kana_conversion.hiragana_to_katakana(reading) not in played_words:
+                return reading
+        for word_id in random.sample(candidates, len(candidates)):
+            reading = self.dictionary.reading(word_id)
+            if kana_conversion.hiragana_to_katakana(reading) not in played_words:
+                return reading
+        return ""
+
+
+class MoraGraph:
+    """
+    Graph of the moves in a local dictionary, with a node per mora and an edge per playable reading, from its first
+    mora to its last. The moves are read from the moves table written by build_local_dictionary. The edges are stored
+    as one array of form ids sorted by first and last mora, so the readings from one mora to another are a slice.
+    """
+
+    def __init__(self, dictionary: LocalDictionary):
+        self.dictionary = dictionary
+        start = time.monotonic()
+        try:
+            moves = dictionary.connection.execute("SELECT form, first_mora, last_mora FROM moves").fetchall()
+        except sqlite3.OperationalError:
+            logger.warning(f"Local dictionary {dictionary.path} has no moves table, rebuild it to load faster")
+            moves = list(playable_moves(dictionary.connection))
+        self.moras = sorted({mora for _, first_mora, last_mora in moves for mora in (first_mora, last_mora)})
+        self.nodes = {mora: node for node, mora in enumerate(self.moras)}
+        # Moras are numbered in sorted order, so sorting by mora sorts by node
+        moves.sort(key=lambda move: move[1:])
+        self.words = array('I', (word_id for word_id, _, _ in moves))
+        self.totals = array('I', [0]) * len(self.moras)
+        # Slices of the words from each first mora node, as tuples of last mora node, start and end of the slice
+        self.edges: dict[int, list[tuple[int, int, int]]] = {}
+        self.slices: dict[tuple[int, int], tuple[int, int]] = {}
+        end = 0
+        for (first_mora, last_mora), group in itertools.groupby(moves, key=lambda move: move[1:]):
+            first = self.nodes[first_mora]
+            begin, end = end, end + sum(1 for _ in group)
+            self.edges.setdefault(first, []).append((self.nodes[last_mora], begin, end))
+            self.slices[first, self.nodes[last_mora]] = (begin, end)
+            self.totals[first] += end - begin
+        logger.info(f"Loaded mora graph of {len(self.words)} words in {time.monotonic() - start:.2f}s")
+
+    def count_moves(self, kata: str) -> int:
+        """
+        Count the edges of a played word. A word can have several edges if the dictionary has more than one reading
+        with the same katakana, such as a hiragana and a katakana spelling.
+
+        :param kata: Katakana of the word
+        :return: Number of edges of the word
+        """
+        if kata[-1] == 'ン' or kata in kana_conversion.set_mora:
+            return 0
+        rows = self.dictionary.connection.execute("SELECT DISTINCT reading FROM forms WHERE reading_key = ?",
+                                                  (kana_conversion.dictionary_key(kata),)).fetchall()
+        return sum(1 for (reading,) in rows if kana_conversion.hiragana_to_katakana(reading) == kata)
+
+
+class MoveCounter:
+    """
+    Counts the unplayed continuations from every mora in a game. Words played since the counter was last used are
+    looked up when it is next used, so the counts are kept up to date without scanning the dictionary every turn.
+    """
+
+    def __init__(self, graph: MoraGraph, played_words: PlayedWords):
+        self.graph = graph
+        self.played_words = played_words
+        self.played: dict[tuple[int, int], int] = {}
+        self.played_from: dict[int, int] = {}
+        self.counted = 0
+        self.lock = threading.Lock()
+
+    def update(self) -> None:
+        """
+        Count the edges of the words played since the last update.
+
+        :return:
+        """
+        with self.lock:
+            for kata in self.played_words.since(self.counted):
+                count = self.graph.count_moves(kata)
+                if not count:
+                    continue
+                mora = kana_conversion.normalise_katakana(kata)
+                edge = (self.graph.nodes[mora[0]], self.graph.nodes[mora[-1]])
+                self.played[edge] = self.played.get(edge, 0) + count
+                self.played_from[edge[0]] = self.played_from.get(edge[0], 0) + count
+            self.counted = len(self.played_words)
+
+    def remaining(self, mora: str) -> int:
+        """
+        Count the unplayed words starting with a mora.
+
+        :param mora: Normalised mora
+        :return: Number of unplayed words
+        """
+        self.update()
+        node = self.graph.nodes.get(mora)
+        return 0 if node is None else self.graph.totals[node] - self.played_from.get(node, 0)
+
+    def pick(self, first: int, last: int) -> str:
+        """
+        Pick a random unplayed reading from one mora to another.
+
+        :param first: Node of the first mora
+        :param last: Node of the last mora
+        :return: Reading of the word, or an empty string if every word between the moras has been played
+        """
+        begin, end = self.graph.slices.get((first, last), (0, 0))
+        for word_id in random.sample(self.graph.words[begin:end], end - begin):
+            reading = self.graph.dictionary.reading(word_id)
+            if kana_conversion.hiragana_to_katakana(reading) not in self.played_words:
+                return reading
+        return ""
+
+    def hint(self, mora: str) -> tuple[str, int] | None:
+        """
+        Find an unplayed word starting with a mora, preferring words whose last mora has the most unplayed
+        continuations.
+
+        :param mora: Normalised mora
+        :return: Pair of the reading of the word and the number of unplayed words starting with its last mora, or None
+        if every word starting with the mora has been played
+        """
+        self.update()
+        first = self.graph.nodes.get(mora)
+        edges = [(self.remaining(self.graph.moras[last]), last)
+                 for last, begin, end in self.graph.edges.get(first, [])
+                 if end - begin > self.played.get((first, last), 0)]
+        for remaining, last in sorted(edges, reverse=True):
+            reading = self.pick(first, last)
+            if reading:
+                # The word itself is about to be played, so it does not count as a continuation
+                return reading, remaining - (last == first)
+        return None
+
+
+class FallbackDictionary(DictionaryBackend):
+    """
+    Searches a primary backend, and only asks the fallback backend when the primary has no results.
+    """
+
+    def __init__(self, primary: DictionaryBackend, fallback: DictionaryBackend):
+        self.primary = primary
+        self.fallback = fallback
+
+    def search(self, term: str) -> dict:
+        return self.primary.search(term) or self.fallback.search(term)
+
+    def has_prefix(self, prefix: str) -> bool:
+        return self.primary.has_prefix(prefix)
+
+    def is_remote(self) -> bool:
+        # The fallback is only asked for words the primary does not have
+        return self.primary.is_remote()
+
+    def search_romaji(self, romaji: str) -> dict | None:
+        # Without results from the primary, romaji is searched through its kana parsings, which asks the fallback
+        return self.primary.search_romaji(romaji) or None
+
+    def search_word(self, word: str) -> dict | None:
+        # Without results from the primary, the word is searched with search, which asks the fallback
+        return self.primary.search_word(word) or None
+
+    def mora_index(self) -> "MoraIndex | None":
+        return self.primary.mora_index()
+
+    def mora_graph(self) -> "MoraGraph | None":
+        return self.primary.mora_graph()
+
+
+class PersistentCache(DictionaryBackend):
+    """
+    Stores the results of another backend in an SQLite file, so they survive restarts. The file uses write-ahead
+    logging, so several bot processes on the same host can share it. Expired lookups are removed periodically.
+    """
+
+    def __init__(self, backend: DictionaryBackend, path: str = CACHE_PATH, ttl: float = CACHE_PERSISTENT_TTL,
+                 negative_ttl: float = CACHE_NEGATIVE_TTL, compact_interval: float = CACHE_COMPACT_INTERVAL):
+        self.backend = backend
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.compact_interval = compact_interval
+        self.last_compaction = time.monotonic()
+        self.local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, "connection"):
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.executescript(CACHE_SCHEMA)
+            self.local.connection = connection
+        return self.local.connection
+
+    def search(self, term: str) -> dict:
+        row = self.connection.execute("SELECT expires, words FROM lookups WHERE term = ?", (term,)).fetchone()
+        if row and row[0] > time.time():
+            return json.loads(row[1])
+
+        words = self.backend.search(term)
+        self.connection.execute("INSERT OR REPLACE INTO lookups VALUES (?, ?, ?)",
+                                (term, time.time() + (self.ttl if words else self.negative_ttl), json.dumps(words)))
+        if time.monotonic() - self.last_compaction > self.compact_interval:
+            self.compact()
+        return words
+
+    def is_remote(self) -> bool:
+        return self.backend.is_remote()
+
+    def compact(self) -> None:
+        """
+        Removes expired lookups and returns their space to the file system.
+
+        :return:
+        """
+        self.last_compaction = time.monotonic()
+        removed = self.connection.execute("DELETE FROM lookups WHERE expires <= ?", (time.time(),)).rowcount
+        self.connection.execute("PRAGMA incremental_vacuum")
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info(f"Compacted lookup cache {self.path}, removed {removed} expired lookups")
+
+
+def load_backend(path: str = DICTIONARY_PATH, jisho_fallback: bool = JISHO_FALLBACK) -> DictionaryBackend:
+    """
+    Loads the dictionary backend to use for the bot. The local dictionary is used if it exists, with Jisho as a
+    fallback if enabled. Without a local dictionary, Jisho is used for every lookup. Jisho results are kept in the
+    persistent lookup cache.
+
+    :param path: Path of the local dictionary
+    :param jisho_fallback: Whether to ask Jisho for words not found in the local dictionary
+    :return: The dictionary backend
+    """
+    if not os.path.exists(path):
+        logger.warning(f"Local dictionary {path} not found, using Jisho for every lookup")
+        return PersistentCache(JishoBackend())
+    local = LocalDictionary(path)
+    if jisho_fallback:
+        return FallbackDictionary(local, PersistentCache(JishoBackend()))
+    return local
+
+
+def build_local_dictionary(source: str, path: str = DICTIONARY_PATH) -> int:
+    """
+    Builds a local dictionary from a JMdict XML dump, replacing any existing dictionary at the path.
+
+    :param source: Path of the JMdict XML file, optionally gzipped
+    :param path: Path of the local dictionary to write
+    :return: Number of entries written
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+
+    opener = gzip.open if source.endswith(".gz") else open
+    count = 0
+    with opener(source, "rb") as f:
+        for _, element in ElementTree.iterparse(f):
+            if element.tag != "entry":
+                continue
+            entry_id = int(element.findtext("ent_seq"))
+            kanji = [k.findtext("keb") for k in element.iter("k_ele")]
+            common = any(element.iter("ke_pri")) or any(element.iter("re_pri"))
+            meanings = [glosses[0].text for sense in element.iter("sense")
+                        if (glosses := [g for g in sense.iter("gloss") if g.get(XML_LANG, "eng") == "eng"])]
+
+            forms = []
+            for r_ele in element.iter("r_ele"):
+                reading = r_ele.findtext("reb")
+                if len(reading) <= 1:
+                    continue
+                restrictions = [r.text for r in r_ele.iter("re_restr")]
+                spellings = [] if r_ele.find("re_nokanji") is not None else restrictions or kanji
+                key = kana_conversion.dictionary_key(reading)
+                forms.extend((entry_id, word, reading, key) for word in spellings or [None])
+
+            element.clear()
+            if not forms or not meanings:
+                continue
+            connection.execute("INSERT INTO entries VALUES (?, ?, ?)", (entry_id, json.dumps(meanings), common))
+            connection.executemany("INSERT INTO forms VALUES (?, ?, ?, ?)", forms)
+            count += 1
+
+    build_indexes(connection)
+    connection.commit()
+    connection.close()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the local shiritori dictionary from a JMdict dump")
+    parser.add_argument("source", help="Path of the JMdict XML file, optionally gzipped")
+    parser.add_argument("--output", default=DICTIONARY_PATH, help="Path of the local dictionary to write")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Built {build_local_dictionary(args.source, args.output)} entries into {args.output}")
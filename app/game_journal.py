@@ -0,0 +1,186 @@
+import itertools
+import json
+import logging
+import os
+import time
+import weakref
+
+from game_options import GameOptions, Pace, InputMode, Difficulty
+from game_state import GameState
+
+logger = logging.getLogger("shiritori-ref")
+
+
+def apply(snapshot: dict, record: dict) -> None:
+    """
+    Apply a journal record to the snapshot of its game.
+
+    :param snapshot: Snapshot of the game
+    :param record: Record of a turn, lost life or knocked out team
+    :return:
+    """
+    if record['type'] == 'turn':
+        snapshot['prev_kata'] = record['kata']
+        snapshot['prev_kanji'] = record['kanji']
+        snapshot['played'].append(record['kata'])
+        snapshot['words'][str(record['player'])] = snapshot['words'].get(str(record['player']), 0) + 1
+        snapshot['current'] = record['current']
+    elif record['type'] == 'life':
+        snapshot['lives'][str(record['team'])] = record['lives']
+    elif record['type'] == 'knockout':
+        snapshot['teams'] = [team for team in snapshot['teams'] if team[0] != record['team']]
+        snapshot['current'] = record['current']
+
+
+class GameJournal:
+    """
+    Append-only log of the running games of this process, so they can be resumed after a restart. A game is journalled
+    as a snapshot when it starts, followed by one small record per accepted word, lost life or knocked out team. The
+    journal is compacted to one snapshot per running game on startup and whenever it grows past a size limit. Only the
+    options of a running game are kept, and its snapshot is taken from its live state when the journal is compacted,
+    so the journal keeps no copy of the words played.
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_size: int = 1 << 20):
+        self.path = path
+        self.fsync = fsync
+        self.compact_size = compact_size
+        self.file = None
+        self.interrupted = self.load()
+        self.games: dict[int, dict] = {}
+        self.states: weakref.WeakValueDictionary[int, GameState] = weakref.WeakValueDictionary()
+        self.ids = itertools.count(max(self.interrupted, default=0) + 1)
+        self.compact()
+
+    def load(self) -> dict[int, dict]:
+        """
+        Read the journal, applying every record to the snapshot of its game.
+
+        :return: Dictionary of game ids and snapshots of the games still running
+        """
+        games = {}
+        if not os.path.exists(self.path):
+            return games
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be incomplete if the process was killed while writing it
+                    logger.warning(f"Skipping corrupt journal record in {self.path}")
+                    continue
+                if record['type'] == 'snapshot':
+                    games[record['game']] = record
+                elif record['type'] == 'end':
+                    games.pop(record['game'], None)
+                elif record['game'] in games:
+                    apply(games[record['game']], record)
+        return games
+
+    def compact(self) -> None:
+        """
+        Rewrite the journal as one snapshot per running game.
+
+        :return:
+        """
+        if self.file:
+            self.file.close()
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for game in [*self.interrupted.values(), *self.snapshots()]:
+                f.write(json.dumps(game, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def snapshots(self) -> list[dict]:
+        """
+        Take snapshots of the running games from their current state.
+
+        :return: List of snapshots
+        """
+        return [{**options, **state.to_dict()} for game_id, options in self.games.items()
+                if (state := self.states.get(game_id)) is not None]
+
+    def write(self, record: dict) -> None:
+        """
+        Append a record to the journal, compacting it if it has grown too large.
+
+        :param record: Record to append
+        :return:
+        """
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        if self.file.tell() > self.compact_size:
+            self.compact()
+
+    def start(self, game_state: GameState, channel_id: int, guild_id: int | None, bot_id: int,
+              options: GameOptions) -> None:
+        """
+        Start journalling a game.
+
+        :param game_state: State of the game
+        :param channel_id: Id of the channel the game is in
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :param bot_id: Id of the bot user
+        :param options: Game options
+        :return:
+        """
+        game_state.journal = self
+        game_state.journal_id = next(self.ids)
+        self.games[game_state.journal_id] = {
+            'type': 'snapshot', 'game': game_state.journal_id, 'channel': channel_id, 'guild': guild_id, 'bot': bot_id,
+            'pace': options.pace.value, 'input_mode': options.input_mode.value, 'chat_on': options.chat_on,
+            'difficulty': options.difficulty.value, 'started': time.time()}
+        self.states[game_state.journal_id] = game_state
+        self.write({**self.games[game_state.journal_id], **game_state.to_dict()})
+
+    def record(self, game_id: int, record: dict) -> None:
+        """
+        Journal a change to a running game, after it has been made to the state of the game.
+
+        :param game_id: Journal id of the game
+        :param record: Record of the change, with a type of turn, life or knockout
+        :return:
+        """
+        if game_id in self.games:
+            self.write({**record, 'game': game_id})
+
+    def end(self, game_state: GameState) -> None:
+        """
+        Stop journalling a game that has ended.
+
+        :param game_state: State of the game
+        :return:
+        """
+        self.states.pop(game_state.journal_id, None)
+        if self.games.pop(game_state.journal_id, None) is not None:
+            self.write({'type': 'end', 'game': game_state.journal_id})
+        game_state.journal = None
+
+    def take_interrupted_games(self) -> list[dict]:
+        """
+        Take the snapshots of the games that were running when the process last stopped, so they can be resumed. The
+        games are removed from the journal, and are journalled again as new games when resumed.
+
+        :return: List of snapshots
+        """
+        games = list(self.interrupted.values())
+        if games:
+            self.interrupted.clear()
+            self.compact()
+        return games
+
+    @staticmethod
+    def options(snapshot: dict) -> GameOptions:
+        """
+        Get the options of a journalled game.
+
+        :param snapshot: Snapshot of the game
+        :return: Game options
+        """
+        return GameOptions(Pace(snapshot['pace']), InputMode(snapshot['input_mode']), snapshot['chat_on'],
+                           Difficulty(snapshot.get('difficulty', Difficulty.EASY.value)))
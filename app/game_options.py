@@ -20,8 +20,21 @@ class InputMode(Enum):
         return [input_mode.value for input_mode in InputMode]
 
 
+class Difficulty(Enum):
+    EASY = "easy"
+    NORMAL = "normal"
+    HARD = "hard"
+
+    @staticmethod
+    def choices():
+        return [difficulty.value for difficulty in Difficulty]
+
+
 class GameOptions:
-    def __init__(self, pace: Pace, input_mode: InputMode, chat_on: bool):
+    __slots__ = ('pace', 'input_mode', 'chat_on', 'difficulty')
+
+    def __init__(self, pace: Pace, input_mode: InputMode, chat_on: bool, difficulty: Difficulty = Difficulty.EASY):
         self.pace = pace
         self.input_mode = input_mode
         self.chat_on = chat_on
+        self.difficulty = difficulty
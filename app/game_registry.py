@@ -0,0 +1,226 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from game_state import GameState
+
+SHARED_SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS games (
+    pid INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    started REAL NOT NULL
+);
+"""
+
+TOO_MANY_GAMES = "There are too many games running right now, please try again later."
+
+
+class SharedGameStore:
+    """
+    Records the games of every bot process on the host in an SQLite file, so shards running in separate processes can
+    share a global game count. Rows left behind by processes that have exited are removed on startup. Another process
+    may hold the write lock for a while, so the async methods run the queries in a single worker thread instead of on
+    the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-games")
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.executescript(SHARED_SCHEMA)
+        self.remove_dead_processes()
+
+    def remove_dead_processes(self) -> None:
+        """
+        Remove the games of processes that are no longer running.
+
+        :return:
+        """
+        for (pid,) in self.connection.execute("SELECT DISTINCT pid FROM games").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self.connection.execute("DELETE FROM games WHERE pid = ?", (pid,))
+            except PermissionError:
+                pass
+
+    def try_add(self, channel_id: int, guild_id: int | None, max_total: int) -> bool:
+        """
+        Record a game started by this process, if fewer than the maximum number of games are running in every process.
+        The count and the insert happen in one transaction, so processes starting games at the same time cannot go over
+        the maximum.
+
+        :param channel_id: Id of the channel the game is in
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :param max_total: Maximum number of games in every process
+        :return: True if the game was recorded
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.count() >= max_total:
+                return False
+            self.connection.execute("INSERT INTO games VALUES (?, ?, ?, ?)",
+                                    (self.pid, channel_id, guild_id, time.time()))
+            return True
+        finally:
+            self.connection.execute("COMMIT")
+
+    def remove(self, channel_id: int) -> None:
+        """
+        Remove a game of this process that has ended.
+
+        :param channel_id: Id of the channel the game is in
+        :return:
+        """
+        self.connection.execute("DELETE FROM games WHERE rowid = "
+                                "(SELECT rowid FROM games WHERE pid = ? AND channel_id = ? LIMIT 1)",
+                                (self.pid, channel_id))
+
+    def count(self) -> int:
+        """
+        Count the games running in every process.
+
+        :return: Number of games
+        """
+        return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    async def run(self, function, *args):
+        """
+        Run a method of the store in its worker thread.
+
+        :param function: Method to run
+        :param args: Arguments of the method
+        :return: Return value of the method
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+
+class GameRegistry:
+    """
+    Keeps track of the games running in this process, and limits how many can run per channel, per guild and in total.
+    A guild always belongs to one shard, so only the total is shared with other processes, through the optional store.
+    """
+
+    def __init__(self, max_per_channel: int, max_per_guild: int, max_total: int, store: SharedGameStore = None):
+        self.max_per_channel = max_per_channel
+        self.max_per_guild = max_per_guild
+        self.max_total = max_total
+        self.store = store
+        self.games: dict[int, list[GameState]] = {}
+        self.guilds: dict[int, set[int]] = {}
+
+    def get_local_rejection_reason(self, channel_id: int, guild_id: int | None) -> str:
+        """
+        Check if a new game can start in a channel, against the limits of this process.
+
+        :param channel_id: Id of the channel
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :return: String containing the reason the game cannot start, or an empty string if it can
+        """
+        if len(self.games.get(channel_id, [])) >= self.max_per_channel:
+            return "There is already a game running in this channel!"
+        if guild_id is not None and self.count_guild(guild_id) >= self.max_per_guild:
+            return "There are too many games running in this server, please try again later."
+        if self.count() >= self.max_total:
+            return TOO_MANY_GAMES
+        return ""
+
+    async def get_rejection_reason(self, channel_id: int, guild_id: int | None) -> str:
+        """
+        Check if a new game can start in a channel. Games can still be rejected when they are added, if other games have
+        started in the meantime.
+
+        :param channel_id: Id of the channel
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :return: String containing the reason the game cannot start, or an empty string if it can
+        """
+        reason = self.get_local_rejection_reason(channel_id, guild_id)
+        if not reason and self.store and await self.store.run(self.store.count) >= self.max_total:
+            return TOO_MANY_GAMES
+        return reason
+
+    async def add(self, channel_id: int, guild_id: int | None, game_state: GameState) -> str:
+        """
+        Register a game that is starting, if it can start in the channel. The game is registered in this process before
+        waiting for the shared store, so two games in one channel cannot both be added.
+
+        :param channel_id: Id of the channel the game is in
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :param game_state: State of the game
+        :return: String containing the reason the game cannot start, or an empty string if it was added
+        """
+        reason = self.get_local_rejection_reason(channel_id, guild_id)
+        if reason:
+            return reason
+        self.games.setdefault(channel_id, []).append(game_state)
+        if guild_id is not None:
+            self.guilds.setdefault(guild_id, set()).add(channel_id)
+        if self.store and not await self.store.run(self.store.try_add, channel_id, guild_id, self.max_total):
+            self.unregister(channel_id, guild_id, game_state)
+            return TOO_MANY_GAMES
+        return ""
+
+    async def remove(self, channel_id: int, guild_id: int | None, game_state: GameState) -> None:
+        """
+        Unregister a game that has ended.
+
+        :param channel_id: Id of the channel the game is in
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :param game_state: State of the game
+        :return:
+        """
+        if self.unregister(channel_id, guild_id, game_state) and self.store:
+            await self.store.run(self.store.remove, channel_id)
+
+    def unregister(self, channel_id: int, guild_id: int | None, game_state: GameState) -> bool:
+        """
+        Remove a game from the games of this process.
+
+        :param channel_id: Id of the channel the game is in
+        :param guild_id: Id of the guild of the channel, or None outside guilds
+        :param game_state: State of the game
+        :return: True if the game was registered
+        """
+        games = self.games.get(channel_id, [])
+        registered = game_state in games
+        if registered:
+            games.remove(game_state)
+        if not games:
+            self.games.pop(channel_id, None)
+            if guild_id is not None:
+                self.guilds.get(guild_id, set()).discard(channel_id)
+                if not self.guilds.get(guild_id):
+                    self.guilds.pop(guild_id, None)
+        return registered
+
+    def count_guild(self, guild_id: int) -> int:
+        """
+        Count the games running in a guild.
+
+        :param guild_id: Id of the guild
+        :return: Number of games
+        """
+        return sum(len(self.games.get(channel_id, [])) for channel_id in self.guilds.get(guild_id, set()))
+
+    def count(self) -> int:
+        """
+        Count every game running in this process.
+
+        :return: Number of games
+        """
+        return sum(len(games) for games in self.games.values())
+
+    async def stats(self) -> dict[str, int]:
+        """
+        Get the counts of running games, for capacity planning.
+
+        :return: Dictionary of the number of games, channels and guilds with games running, and the number of games in
+        every process sharing the store
+        """
+        return {'games': self.count(), 'channels': len(self.games), 'guilds': len(self.guilds),
+                'all_processes': await self.store.run(self.store.count) if self.store else self.count()}
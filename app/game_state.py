@@ -1,10 +1,22 @@
+from enum import Enum
+
 import nextcord
 
 import kana_conversion
+from played_words import PlayedWords
 from team import Team
 
 
+class Outcome(Enum):
+    PLAYING = "playing"
+    WON = "won"
+    LOST = "lost"
+
+
 class GameState:
+    __slots__ = ('teams', 'current_team', 'lives', 'num_words_played', 'prev_kata', 'prev_kanji', 'prev_mora',
+                 'played_words', 'journal', 'journal_id', '__weakref__')
+
     def __init__(self, teams: list[Team]):
         self.teams = teams
         self.current_team = teams[0]
@@ -12,21 +24,57 @@ class GameState:
         self.num_words_played = {user: 0 for team in teams for user in team.players}
         self.prev_kata = ""
         self.prev_kanji = ""
-        self.played_words = set()
+        self.prev_mora = ""
+        self.played_words = PlayedWords()
+        self.journal = None
+        self.journal_id = 0
+
+    def play_word(self, kata: str, kanji: str, player: nextcord.User) -> None:
+        """
+        Accept a word played by the current team and pass the turn to the next team.
+
+        :param kata: Katakana of the word
+        :param kanji: Kanji of the word
+        :param player: The player who played the word
+        :return:
+        """
+        self.set_previous_word(kata, kanji)
+        self.played_words.add(kata)
+        self.current_team = self.teams[(self.teams.index(self.current_team) + 1) % len(self.teams)]
+        self.num_words_played[player] += 1
+        if self.journal:
+            self.journal.record(self.journal_id, {'type': 'turn', 'kata': kata, 'kanji': kanji, 'player': player.id,
+                                                  'current': self.current_team.id})
+
+    def set_previous_word(self, kata: str, kanji: str) -> None:
+        """
+        Set the word the next word must follow, keeping its last mora so words are matched against it without
+        normalising it again.
+
+        :param kata: Katakana of the word
+        :param kanji: Kanji of the word
+        :return:
+        """
+        self.prev_kata = kata
+        self.prev_kanji = kanji
+        self.prev_mora = kana_conversion.end_mora(kata) if kata else ""
 
-    def knockout_team(self) -> bool:
+    def knockout_team(self) -> Outcome:
         """
-        Remove the current team from the game. If only one team remains, declare them the winner.
+        Remove the current team from the game. If only one team remains, they are the winner. If no team remains, as
+        when the only team of a survival game is knocked out, the game is lost and the knocked out team stays current.
 
-        :return: True if only one team remains, False otherwise
+        :return: Outcome of the game after the knockout
         """
         index = self.teams.index(self.current_team)
-        self.teams.pop(index)
-        if len(self.teams) == 1:
-            self.current_team = self.teams[0]
-            return True
-        self.current_team = self.teams[index % len(self.teams)]
-        return False
+        knocked_out = self.teams.pop(index)
+        self.current_team = self.teams[index % len(self.teams)] if self.teams else knocked_out
+        if self.journal:
+            self.journal.record(self.journal_id, {'type': 'knockout', 'team': knocked_out.id,
+                                                  'current': self.current_team.id})
+        if not self.teams:
+            return Outcome.LOST
+        return Outcome.WON if len(self.teams) == 1 else Outcome.PLAYING
 
     async def lose_life(self, reason: str, inter: nextcord.Interaction) -> None:
         """
@@ -37,6 +85,9 @@ class GameState:
         :return:
         """
         self.lives[self.current_team.id] -= 1
+        if self.journal:
+            self.journal.record(self.journal_id, {'type': 'life', 'team': self.current_team.id,
+                                                  'lives': self.lives[self.current_team.id]})
         await inter.channel.send(f"{reason} You have {self.lives[self.current_team.id]} lives remaining.")
 
     def get_invalid_reasons(self, kata: str) -> str:
@@ -51,8 +102,7 @@ class GameState:
         :param kata: Katakana of the word to check
         :return: String containing the reason the word is invalid, or an empty string if the word is valid
         """
-        prev_kata = self.prev_kata
-        if not prev_kata:
+        if not self.prev_kata:
             return ""
         elif not kata:
             return "is not a valid Romaji word!"
@@ -60,12 +110,24 @@ class GameState:
             return "is only one mora!"
         elif kata in self.played_words:
             return "has already been played!"
-        elif not kana_conversion.match_kana(prev_kata, kana_conversion.hiragana_to_katakana(kata)):
+        elif not self.follows_previous_word(kana_conversion.hiragana_to_katakana(kata)):
             return "does not match the previous word!"
         elif kata[-1] == 'ン':
             return "ends with ん!"
         return ""
 
+    def follows_previous_word(self, kata: str) -> bool:
+        """
+        Check if a word can follow the previous word. Almost every word that can starts with the last mora of the
+        previous word, which is checked against the cached mora without normalising either word. Words that overlap
+        the end of the previous word by more than one mora, such as トリアエズ after シリトリ, are also accepted.
+
+        :param kata: Katakana of the word
+        :return: True if the word matches the previous word
+        """
+        return (kana_conversion.match_mora(self.prev_mora, kana_conversion.start_mora(kata))
+                or kana_conversion.match_kana(self.prev_kata, kata))
+
     def get_streak(self) -> int:
         """
         Get the current game streak.
@@ -102,8 +164,8 @@ class GameState:
         :param inter: Interaction object
         :return:
         """
-        last_kata = kana_conversion.normalise_katakana(self.prev_kata)[-1] \
-            if self.prev_kata[-1] not in "ャュョァィェォ" else self.prev_kata[-2:]
+        # Yoon are announced as written, since their normalised key spells the small kana large
+        last_kata = self.prev_kata[-2:] if len(self.prev_mora) > 1 else self.prev_mora
         last_hira = kana_conversion.katakana_to_hiragana(last_kata)
         romaji = kana_conversion.kana_to_romaji(self.prev_kata)
         last_romaji = kana_conversion.kana_to_romaji(last_kata)
@@ -111,3 +173,36 @@ class GameState:
             f"The word was: {self.prev_kanji} ({romaji})\n"
             f"The letter to start is:"
             f" {last_hira or last_kata} ({last_romaji})")
+
+    def to_dict(self) -> dict:
+        """
+        Convert the game state to a dictionary of plain values, referring to users and teams by id.
+
+        :return: Dictionary of the game state
+        """
+        return {
+            'teams': [[user.id for user in team.players] for team in self.teams],
+            'current': self.current_team.id,
+            'lives': {str(team_id): lives for team_id, lives in self.lives.items()},
+            'words': {str(user.id): num for user, num in self.num_words_played.items()},
+            'prev_kata': self.prev_kata,
+            'prev_kanji': self.prev_kanji,
+            'played': list(self.played_words),
+        }
+
+    @staticmethod
+    def from_dict(data: dict, users: dict[int, nextcord.User]) -> "GameState":
+        """
+        Rebuild a game state from a dictionary made by to_dict.
+
+        :param data: Dictionary of the game state
+        :param users: Users of the game by id
+        :return: The game state
+        """
+        game_state = GameState([Team([users[user_id] for user_id in team]) for team in data['teams']])
+        game_state.current_team = next(team for team in game_state.teams if team.id == data['current'])
+        game_state.lives = {int(team_id): lives for team_id, lives in data['lives'].items()}
+        game_state.num_words_played = {users[int(user_id)]: num for user_id, num in data['words'].items()}
+        game_state.set_previous_word(data['prev_kata'], data['prev_kanji'])
+        game_state.played_words = PlayedWords(data['played'])
+        return game_state
@@ -2,19 +2,57 @@ import asyncio
 import logging
 import random
 import re
+import weakref
 from typing import Callable, Awaitable
 
 import nextcord.ui
 from nextcord import ButtonStyle
 
+import bot_search
 import kana_conversion
-from game_options import GameOptions, Pace, InputMode
-from game_state import GameState
+import metrics
+from dictionary import MoveCounter
+from game_options import GameOptions, Pace, InputMode, Difficulty
+from game_state import GameState, Outcome
+from message_outbox import MessageOutbox, OutboxInteraction
 from team import Team
 from constants import *
 
 logger = logging.getLogger("shiritori-ref")
 
+# Move counters of the running games, for hints and the bot's search, dropped with their game
+move_counters = weakref.WeakKeyDictionary()
+SEARCH_DEPTHS = {Difficulty.NORMAL: 1, Difficulty.HARD: BOT_SEARCH_DEPTH}
+# Prefetches of every game share a few dictionary threads, so they never hold up the lookups of a turn
+prefetch_slots = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+
+def prefetch(lookup: Awaitable[dict]) -> Awaitable[dict]:
+    """
+    Start a lookup ahead of time, to run once a prefetch slot is free. The lookup is shielded, so cancelling the
+    prefetch never cancels a lookup another game is waiting on, and the lookup keeps its slot until it finishes.
+
+    :param lookup: The lookup to run
+    :return: Future of the result of the lookup
+    """
+    async def run() -> dict:
+        async with prefetch_slots:
+            return await lookup
+
+    return asyncio.shield(run())
+
+
+async def get_move_counter(game_state: GameState) -> MoveCounter | None:
+    """
+    Get the move counter of a game, starting one if the game does not have one yet.
+
+    :param game_state: The state of the game
+    :return: The move counter, or None if the dictionary has no graph
+    """
+    if game_state not in move_counters:
+        move_counters[game_state] = await kana_conversion.get_move_counter(game_state.played_words)
+    return move_counters[game_state]
+
 
 class DuelView(nextcord.ui.View):
     def __init__(self,
@@ -54,16 +92,183 @@ class DuelView(nextcord.ui.View):
             await self.message.edit(content=self.edit_message, view=None)
 
 
+async def play_game(
+        inter: nextcord.Interaction,
+        teams: list[Team],
+        options: GameOptions,
+        bot_user: nextcord.User,
+        wait_for_user_input: Callable[[Callable[[nextcord.Message], bool]], Awaitable[nextcord.Message]],
+        game_state: GameState = None,
+) -> None:
+    """
+    Plays a duel or battle until one team remains or the game is ended. The messages of the game are sent through an
+    outbox, which is flushed before waiting for a player, so the messages of each turn are sent together. While a
+    player thinks, the words of the next turn are prefetched in the background.
+
+    :param inter: Interaction object
+    :param teams: List of teams
+    :param options: Game options
+    :param bot_user: The user of the bot, who takes their turns automatically
+    :param wait_for_user_input: Function to wait for a message
+    :param game_state: State of the game, a new game is started if not given
+    :return:
+    """
+    outbox = MessageOutbox(inter.channel)
+    game_state = game_state or GameState(teams)
+    prefetch_task = None
+
+    @metrics.timed("player_think", "Time players take to answer, including the time to deliver the prompt")
+    async def flush_and_wait_for_user_input(check) -> nextcord.Message:
+        nonlocal prefetch_task
+        outbox.flush()
+        if PREFETCH_ENABLED and game_state.prev_kata and kana_conversion.get_dictionary_backend().is_remote():
+            if prefetch_task is not None:
+                prefetch_task.cancel()
+            prefetch_task = asyncio.create_task(prefetch_next_turn(game_state, bot_user))
+        return await wait_for_user_input(check)
+
+    try:
+        await run_game(OutboxInteraction(inter, outbox), teams, options, bot_user, flush_and_wait_for_user_input,
+                       game_state)
+    finally:
+        if prefetch_task is not None:
+            prefetch_task.cancel()
+        await outbox.close()
+        logger.info("Sent %d messages to %s", outbox.requests, inter.channel,
+                    extra={'channel': inter.channel.id, 'requests': outbox.requests})
+
+
+async def prefetch_next_turn(game_state: GameState, bot_user: nextcord.User) -> None:
+    """
+    Warm the lookup cache while a player thinks, for dictionaries searched over the network. Their answer must start
+    with the last mora of the previous word, so the words starting with it are fetched, and the most common of them
+    looked up, for validating the answer. If the bot plays next, the words starting with the last moras of the most
+    common words are fetched too, the way the bot looks them up.
+
+    :param game_state: State of the game
+    :param bot_user: The user of the bot
+    :return:
+    """
+    last_kata = kana_conversion.last_mora(game_state.prev_kata)
+    teams = game_state.teams
+    next_team = teams[(teams.index(game_state.current_team) + 1) % len(teams)]
+    try:
+        words = await prefetch(kana_conversion.prefetch_words_starting_with(last_kata))
+        readings = list(words)[:PREFETCH_READINGS]
+        await asyncio.gather(*[prefetch(kana_conversion.search_jisho(reading)) for reading in readings])
+        if bot_user not in next_team:
+            return
+        # The bot looks up the last kana of the normalised word, so a final yoon such as シャ is looked up as ヤ
+        moras = dict.fromkeys(kana_conversion.normalise_katakana(kana_conversion.hiragana_to_katakana(reading))[-1]
+                              for reading in readings if reading[-1] not in "んン")
+        await asyncio.gather(*[prefetch(kana_conversion.prefetch_words_starting_with(mora))
+                               for mora in list(moras)[:PREFETCH_FOLLOW_UPS]])
+    except Exception as e:
+        logger.debug("Could not prefetch the words after %s: %s", last_kata, e)
+
+
+async def run_game(
+        inter: nextcord.Interaction,
+        teams: list[Team],
+        options: GameOptions,
+        bot_user: nextcord.User,
+        wait_for_user_input: Callable[[Callable[[nextcord.Message], bool]], Awaitable[nextcord.Message]],
+        game_state: GameState = None,
+) -> None:
+    """
+    Runs the turns of a game until one team remains or the game is ended.
+
+    :param inter: Interaction object
+    :param teams: List of teams
+    :param options: Game options
+    :param bot_user: The user of the bot, who takes their turns automatically
+    :param wait_for_user_input: Function to wait for a message
+    :param game_state: State of the game, a new game is started if not given
+    :return:
+    """
+    game_state = game_state or GameState(teams)
+    if bot_user not in [u for team in teams for u in team.players] and not game_state.prev_kata:
+        await inter.channel.send(f"{teams[0].to_string()},"
+                                 f" as the challenged, you have the right of the first word.")
+
+    while True:
+        logger.debug("Streak %d, lives %s", game_state.get_streak(), dict(game_state.lives),
+                     extra={'channel': inter.channel.id, 'streak': game_state.get_streak()})
+        current_id = game_state.current_team.id
+
+        if game_state.lives[current_id] <= 0:
+            await inter.channel.send(
+                f"{game_state.current_team.to_string()} {'have' if len(game_state.current_team) > 1 else 'has'}"
+                f" lost all their lives. ")
+            outcome = game_state.knockout_team()
+            if outcome != Outcome.PLAYING:
+                await announce_outcome(inter, game_state, outcome)
+                break
+
+        # Bot's turn
+        if bot_user in game_state.current_team:
+            (played_kata, played_kanji) = await take_bot_turn(inter, game_state, options.difficulty)
+            logger.info("Bot played %s", played_kata, extra={'channel': inter.channel.id, 'word': played_kata})
+            if played_kata:
+                game_state.play_word(played_kata, played_kanji, bot_user)
+                continue
+            else:
+                break
+
+        await game_state.announce_streak(inter)
+
+        # User's turn
+        (is_alive, played_kata, played_kanji, player) = await take_user_turn(
+            inter, options, game_state, wait_for_user_input
+        )
+
+        if not is_alive:
+            outcome = game_state.knockout_team()
+            if outcome != Outcome.PLAYING:
+                await announce_outcome(inter, game_state, outcome)
+                break
+            continue
+        if not played_kata:
+            continue
+
+        game_state.play_word(played_kata, played_kanji, player)
+
+    # The game has ended
+    await inter.channel.send(
+        f"The final streak was {game_state.get_streak()}!\n" +
+        "\n".join([f"{user.global_name or user.display_name} played {num} words"
+                   for user, num in game_state.num_words_played.items()]))
+
+
+async def announce_outcome(inter: nextcord.Interaction, game_state: GameState, outcome: Outcome) -> None:
+    """
+    Announce the end of a game, won by the last team remaining or lost by the last team knocked out.
+
+    :param inter: Interaction object
+    :param game_state: State of the game
+    :param outcome: Outcome of the game
+    :return:
+    """
+    if outcome == Outcome.WON:
+        await inter.channel.send(f"{game_state.current_team.to_string(mention=True)} has won!")
+    else:
+        await inter.channel.send(f"{game_state.current_team.to_string(mention=True)} has lost! Game over.")
+
+
+@metrics.timed("take_bot_turn", "Time the bot takes for a turn")
 async def take_bot_turn(
         inter: nextcord.Interaction,
         game_state: GameState,
+        difficulty: Difficulty = Difficulty.EASY,
 ) -> (str, str):
     """
     Take a turn for the bot. The bot will try to play a word that starts with the last kana of the previous word. If no
-    such word exists, the bot will announce their loss.
+    such word exists, the bot will announce their loss. Above the easy difficulty, the bot searches for the word that
+    leaves the fewest words for the next player, otherwise it picks a random word.
 
     :param inter: The interaction object
     :param game_state: The state of the game
+    :param difficulty: Difficulty of the bot
     :return: The kana and kanji of the word to play
     """
     prev_kata = kana_conversion.normalise_katakana(game_state.prev_kata) or "ア"
@@ -71,11 +276,24 @@ async def take_bot_turn(
 
     await inter.channel.send(f"My turn!")
 
+    move_counter = await get_move_counter(game_state) if difficulty != Difficulty.EASY else None
+    if move_counter:
+        reading = await bot_search.search_move(move_counter, prev_kata, BOT_SEARCH_TIME, SEARCH_DEPTHS[difficulty])
+    else:
+        reading = await kana_conversion.get_unplayed_word_starting_with(prev_kata, played_words)
+    if reading:
+        words = await kana_conversion.search_jisho(reading)
+        await inter.channel.send(kana_conversion.meaning_to_string(words[reading]))
+        return kana_conversion.hiragana_to_katakana(reading), words[reading][0]['word'] or reading
+    if reading is not None:
+        await inter.channel.send("I have no words to play! You win!")
+        return "", ""
+
     words_hira = await kana_conversion.get_words_starting_with(kana_conversion.katakana_to_hiragana(prev_kata))
     hira_candidates = [k for k in words_hira.keys() if
                        kana_conversion.hiragana_to_katakana(k) not in played_words and k[-1] != 'ん']
 
-    logger.info(f"Hira candidates: {hira_candidates}")
+    logger.debug("%d hiragana candidates", len(hira_candidates), extra={'channel': inter.channel.id})
 
     if hira_candidates:
         hira = hira_candidates[random.randint(0, len(hira_candidates) - 1)]
@@ -86,7 +304,7 @@ async def take_bot_turn(
     words_kata = await kana_conversion.get_words_starting_with(prev_kata)
     kata_candidates = [k for k in words_kata.keys() if k not in played_words and k[-1] != 'ン']
 
-    logger.info(f"Kata candidates: {kata_candidates}")
+    logger.debug("%d katakana candidates", len(kata_candidates), extra={'channel': inter.channel.id})
 
     if kata_candidates:
         kata = kata_candidates[random.randint(0, len(kata_candidates) - 1)]
@@ -98,6 +316,7 @@ async def take_bot_turn(
     return "", ""
 
 
+@metrics.timed("take_user_turn", "Time a player's turn takes, including the time the player thinks")
 async def take_user_turn(
         inter: nextcord.Interaction,
         options: GameOptions,
@@ -124,8 +343,7 @@ async def take_user_turn(
 
     try:
         def check(msg: nextcord.Message):
-            logger.info(msg.content[0:2])
-            return (msg.channel == inter.channel and msg.author in game_state.current_team and
+            return (msg.channel.id == inter.channel.id and msg.author in game_state.current_team and
                     (not options.chat_on or msg.content[0:2] in MESSAGE_BEGIN))
 
         response_msg = (await wait_for_user_input(check))
@@ -140,7 +358,8 @@ async def take_user_turn(
         await inter.channel.send(f"{game_state.current_team.to_string()} has ended the game.")
         return False, "", "", None
 
-    logger.info(f"{response_msg.author.global_name} played {response}")
+    logger.info("%s played %s", response_msg.author.global_name, response,
+                extra={'channel': inter.channel.id, 'player': response_msg.author.id, 'word': response})
 
     if kana_conversion.is_romaji(response):
         if options.input_mode == InputMode.ROMAJI:
@@ -172,7 +391,7 @@ async def process_player_romaji(
     :return: Pair containing the katakana and kanji of the word played if the word is valid, otherwise an empty string
     """
     romaji = kana_conversion.remove_romaji_long_vowels(response)
-    hira, kata = kana_conversion.romaji_to_hira_kata(kana_conversion.kana_to_romaji(response))
+    hira, kata = await kana_conversion.parse_romaji(kana_conversion.kana_to_romaji(response))
 
     if not kata:
         await inter.channel.send(f"{response} is not a valid romaji word.")
@@ -187,13 +406,12 @@ async def process_player_romaji(
         await invalid_word(invalid[0])
         return "", ""
 
-    words_romaji = {kana_conversion.kana_to_romaji(k): v
-                    for k, v in (await kana_conversion.search_jisho(romaji)).items()}
-    for k in kata:
-        words_romaji.update({kana_conversion.kana_to_romaji(k): v
-                             for k, v in (await kana_conversion.search_jisho(k)).items()})
-    logger.info(f"Romaji dictionary: {str(words_romaji.keys())}")
     normalised = kana_conversion.kana_to_romaji(kata[0])
+    words_romaji = await kana_conversion.search_romaji(normalised)
+    if words_romaji is None:
+        words_romaji = {kana_conversion.kana_to_romaji(k): v
+                        for k, v in (await kana_conversion.search_jisho_many([romaji] + kata)).items()}
+    logger.debug("%d romaji dictionary matches", len(words_romaji), extra={'channel': inter.channel.id})
 
     if normalised not in words_romaji and response not in words_romaji:
         await invalid_word(f"is not a valid word.")
@@ -231,10 +449,14 @@ async def process_player_kana(
         await game_state.lose_life(f"{response} {invalid}", inter)
         return "", ""
 
-    await inter.channel.send(kana_conversion.meaning_to_string(words[response]))
+    # Katakana and long vowel spellings find the entry of the word, keyed by the reading of the dictionary
+    key = kana_conversion.dictionary_key(response)
+    reading = response if response in words else \
+        next((r for r in words if kana_conversion.dictionary_key(r) == key), next(iter(words)))
+    await inter.channel.send(kana_conversion.meaning_to_string(words[reading]))
 
     kata = kana_conversion.hiragana_to_katakana(response)
-    kanji = words[response][0]['word'] or words[response][0]['reading']
+    kanji = words[reading][0]['word'] or words[reading][0]['reading']
 
     return kata, kanji
 
@@ -253,17 +475,20 @@ async def process_player_kanji(
     :param game_state: State of the game
     :return: Pair containing the katakana and kanji of the word played if the word is valid, otherwise an empty string
     """
-    words = await kana_conversion.search_jisho(response)
+    words = await kana_conversion.search_word(response)
+    if words is None:
+        words = await kana_conversion.search_jisho(response)
+        candidates = [w['reading'] for _, word in words.items() for w in word
+                      if (w['word'] == response if w['word'] else w['reading'] == response)]
+    else:
+        candidates = list(words)
 
     if not words:
         await game_state.lose_life(f"{response} is not a valid word.", inter)
         return "", ""
 
-    readings = [w['reading']
-                for _, word in words.items()
-                for w in word if
-                (w['word'] == response if w['word'] else w['reading'] == response)
-                and not game_state.get_invalid_reasons(w['reading'])]
+    readings = [reading for reading in candidates
+                if not game_state.get_invalid_reasons(kana_conversion.hiragana_to_katakana(reading))]
 
     if not readings:
         await game_state.lose_life(f"{response} is not a valid word.", inter)
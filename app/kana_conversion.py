@@ -1,8 +1,24 @@
+import asyncio
 import logging
-from jisho_api.word import Word
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import groupby, islice
+from typing import Callable, Iterator
+
+import dictionary
+import metrics
+from constants import DICTIONARY_WORKERS, CACHE_SIZE, CACHE_TTL, CACHE_NEGATIVE_TTL, BATCH_CONCURRENCY, \
+    MAX_ROMAJI_LENGTH, MAX_ROMAJI_VARIANTS, LOG_SAMPLE
+from lookup_cache import LookupCache
+from played_words import PlayedWords
 
 logger = logging.getLogger("shiritori-ref")
 
+dictionary_backend: "dictionary.DictionaryBackend | None" = None
+dictionary_executor = ThreadPoolExecutor(max_workers=DICTIONARY_WORKERS, thread_name_prefix="dictionary")
+lookup_cache = LookupCache(CACHE_SIZE, CACHE_TTL, CACHE_NEGATIVE_TTL)
+
 
 def match_kana(previous: str, current: str) -> bool:
     """
@@ -16,13 +32,57 @@ def match_kana(previous: str, current: str) -> bool:
         return False
     p = normalise_katakana(previous)
     c = normalise_katakana(current)
-    logger.info(f"Matching {p} with {c}")
+    logger.debug("Matching %s with %s", p, c, extra={'sample': LOG_SAMPLE})
     for i in range(min(len(p), len(c))):
         if p[len(p) - 1 - i:] == c[:i + 1]:
             return True
     return False
 
 
+def start_mora(kata: str) -> str:
+    """
+    Gets the normalised first mora of a word, with the small kana of a yoon such as キャ, from its first two kana only
+
+    :param kata: Katakana of the word
+    :return: Normalised first mora
+    """
+    return normalise_katakana(kata[:2] if kata[1:2] in small_kana else kata[:1])
+
+
+def end_mora(kata: str) -> str:
+    """
+    Gets the normalised last mora of a word, with the kana before a final small kana, and long vowels resolved
+
+    :param kata: Katakana of the word
+    :return: Normalised last mora
+    """
+    normalised = normalise_katakana(kata)
+    return normalised[-2:] if kata[-1] in small_kana else normalised[-1:]
+
+
+def last_mora(kata: str) -> str:
+    """
+    Gets the last mora of a word as written, with the kana before a final small kana, and long vowels resolved
+
+    :param kata: Katakana of the word
+    :return: Last mora
+    """
+    return kata[-2:] if kata[-1] in small_kana else normalise_katakana(kata)[-1]
+
+
+def match_mora(end: str, start: str) -> bool:
+    """
+    Checks if a word starting with a mora can follow a word ending with a mora. The word must start with the whole
+    last mora, or with its last kana, so a word ending in シャ can be followed by シャ or ヤ.
+
+    :param end: Normalised last mora of the previous word
+    :param start: Normalised first mora of the current word
+    :return:
+    """
+    return start == end or start[:1] == end[-1:]
+
+
+@lru_cache(maxsize=4096)
 def normalise_katakana(katakana: str) -> str:
     """
     Normalises katakana by converting choonpu to the correct kana, normalising rare/ interchangeable kana and small kana
@@ -30,57 +90,111 @@ def normalise_katakana(katakana: str) -> str:
     :param katakana: Katakana to normalise
     :return: Normalised katakana
     """
-    def choonpu_to_kana(kana: str) -> str:
-        return kana in set_a and 'ア' or \
-            kana in set_e and 'イ' or \
-            kana in set_i and 'イ' or \
-            kana in set_o and 'ウ' or \
-            kana in set_u and 'ウ' or \
-            kana
-
-    kata = katakana[0]
-    for i in range(1, len(katakana)):
-        kata = kata + (katakana[i] if katakana[i] != 'ー' else choonpu_to_kana(katakana[i - 1]))
-    normal_map = {
-        'ヂ': 'ジ', 'ヅ': 'ズ',
-        'ャ': 'ヤ', 'ュ': 'ユ', 'ョ': 'ヨ',
-        'ァ': 'ア', 'ィ': 'イ', 'ゥ': 'ウ', 'ェ': 'エ', 'ォ': 'オ'
-    }
-    return ''.join(normal_map.get(c, c) for c in kata)
+    kata = katakana[:1] + ''.join(c if c != 'ー' else choonpu_to_kana.get(p, p) for p, c in zip(katakana, katakana[1:]))
+    return kata.translate(normal_table)
+
+
+def get_dictionary_backend() -> "dictionary.DictionaryBackend":
+    """
+    Get the dictionary backend, loading it on first use.
+
+    :return: The dictionary backend
+    """
+    global dictionary_backend
+    if dictionary_backend is None:
+        dictionary_backend = dictionary.load_backend()
+    return dictionary_backend
 
 
+@metrics.timed("search_jisho", "Time to look up a term, including lookup cache hits")
 async def search_jisho(term: str) -> dict:
     """
-    Searches the Jisho API for a term
+    Searches the dictionary for a term. The local dictionary is used if available, otherwise the Jisho API. The search
+    runs in the dictionary thread pool so a slow lookup does not block the event loop, and results are shared between
+    games through the lookup cache.
 
     :param term: Search term
     :return: A dictionary with keys as readings and values a dictionary with keys: word, meanings, reading which are the
     word, meanings and reading of the word respectively.
     """
-    wr = Word.request(term)
-    if not wr:
-        return {}
+    backend = get_dictionary_backend()
+
+    async def fetch() -> dict:
+        return await asyncio.get_running_loop().run_in_executor(dictionary_executor, backend.search, term)
+
+    return await lookup_cache.get(term, fetch)
+
+
+async def search_romaji(romaji: str) -> dict | None:
+    """
+    Searches the romaji index of the dictionary for readings written the same in romaji, ignoring long vowels.
+
+    :param romaji: Romaji search term
+    :return: A dictionary with keys as the romaji of the readings and values a list of word information dictionaries,
+    or None if the dictionary has no romaji index
+    """
+    backend = get_dictionary_backend()
+
+    async def fetch() -> dict | None:
+        return await asyncio.get_running_loop().run_in_executor(dictionary_executor, backend.search_romaji, romaji)
+
+    return await lookup_cache.get(f"romaji:{romaji}", fetch)
+
+
+async def search_word(word: str) -> dict | None:
+    """
+    Searches the spelling index of the dictionary for the readings of a written word.
+
+    :param word: Written word, usually in kanji
+    :return: A dictionary with keys as the readings of the word and values a list of word information dictionaries, or
+    None if the dictionary has no spelling index
+    """
+    backend = get_dictionary_backend()
+
+    async def fetch() -> dict | None:
+        return await asyncio.get_running_loop().run_in_executor(dictionary_executor, backend.search_word, word)
+
+    return await lookup_cache.get(f"word:{word}", fetch)
+
+
+async def parse_romaji(word: str) -> tuple[list[str], list[str]]:
+    """
+    Converts romaji to its possible hiragana and katakana parsings, pruning parsings no dictionary reading starts with.
+    Pruning may query the dictionary, so the parse runs in the dictionary thread pool.
+
+    :param word: The romaji to convert
+    :return: All possible hiragana and katakana parsings of the word
+    """
+    backend = get_dictionary_backend()
+    return await asyncio.get_running_loop().run_in_executor(dictionary_executor, romaji_to_hira_kata, word,
+                                                            backend.has_prefix)
+
+
+async def search_jisho_many(terms: list[str], max_concurrent: int = BATCH_CONCURRENCY) -> dict:
+    """
+    Searches the dictionary for several terms concurrently, searching each distinct term once.
+
+    :param terms: Search terms
+    :param max_concurrent: Maximum number of searches running at once
+    :return: The results of every search merged, in the same shape as search_jisho. Readings found by several searches
+    keep the words of the last of those searches, in the order of the terms.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def search(term: str) -> dict:
+        async with semaphore:
+            return await search_jisho(term)
+
     words = {}
-    for x in wr.dict()['data']:
-        for y in x['japanese']:
-            reading = y['reading']
-            if not reading or len(reading) <= 1:
-                continue
-            word_info = {'word': y['word'],
-                         'meanings': [sense['english_definitions'][0] for sense in x['senses']],
-                         'reading': reading
-                         }
-
-            if reading in words:
-                words[reading].append(word_info)
-            else:
-                words[reading] = [word_info]
+    for result in await asyncio.gather(*[search(term) for term in dict.fromkeys(terms)]):
+        words.update(result)
     return words
 
 
+@metrics.timed("get_words_starting_with", "Time to look up the words starting with the last kana of a word")
 async def get_words_starting_with(word: str) -> dict:
     """
-    Uses the Jisho API to get words starting with the last kana of the word.
+    Uses the dictionary to get words starting with the last kana of the word.
 
     :param word:
     :return:
@@ -90,6 +204,89 @@ async def get_words_starting_with(word: str) -> dict:
     return {k: v for k, v in words.items() if k.startswith(start)}
 
 
+async def prefetch_words_starting_with(word: str) -> dict:
+    """
+    Fetch the words starting with the last kana of the word ahead of time, in hiragana and katakana as the bot looks
+    them up.
+
+    :param word: Katakana of the previous word
+    :return: The words starting with the last kana of the word, the most common first
+    """
+    words = {}
+    # Moras only written in katakana, such as ヴ, have no hiragana words
+    for result in await asyncio.gather(*[get_words_starting_with(w) for w in (katakana_to_hiragana(word), word) if w]):
+        words.update(result)
+    return words
+
+
+async def get_unplayed_word_starting_with(word: str, played_words: PlayedWords) -> str | None:
+    """
+    Uses the starting mora index of the dictionary to pick a random unplayed word starting with the last mora of the
+    word, without searching the dictionary.
+
+    :param word: Katakana of the previous word
+    :param played_words: Katakana of the words already played
+    :return: Reading of the word, an empty string if there is none, or None if the dictionary has no index
+    """
+    backend = get_dictionary_backend()
+
+    def pick() -> str | None:
+        index = backend.mora_index()
+        return index.random_unplayed(normalise_katakana(word)[-1], played_words) if index else None
+
+    return await asyncio.get_running_loop().run_in_executor(dictionary_executor, pick)
+
+
+async def load_indexes() -> None:
+    """
+    Loads the starting mora index and the mora graph of the dictionary, which are otherwise loaded by the first game
+    needing them.
+
+    :return:
+    """
+    backend = get_dictionary_backend()
+
+    def load() -> None:
+        backend.mora_index()
+        backend.mora_graph()
+
+    await asyncio.get_running_loop().run_in_executor(dictionary_executor, load)
+
+
+async def get_move_counter(played_words: PlayedWords) -> "dictionary.MoveCounter | None":
+    """
+    Loads the mora graph of the dictionary, and starts counting the unplayed continuations of a game.
+
+    :param played_words: Katakana of the words already played
+    :return: The move counter, or None if the dictionary has no graph
+    """
+    backend = get_dictionary_backend()
+
+    def load() -> "dictionary.MoveCounter | None":
+        graph = backend.mora_graph()
+        return dictionary.MoveCounter(graph, played_words) if graph else None
+
+    return await asyncio.get_running_loop().run_in_executor(dictionary_executor, load)
+
+
+async def get_hint(word: str, move_counter: "dictionary.MoveCounter") -> tuple[int, str, int]:
+    """
+    Finds a word to play after a word, preferring words that leave the most unplayed continuations.
+
+    :param word: Katakana of the previous word
+    :param move_counter: Move counter of the game
+    :return: Tuple of the number of unplayed words starting with the last mora of the word, the reading of the hint
+    or an empty string if there is none, and the number of unplayed words the hint leaves
+    """
+    mora = normalise_katakana(word)[-1]
+
+    def find() -> tuple[int, str, int]:
+        hint = move_counter.hint(mora)
+        return move_counter.remaining(mora), *(hint or ("", 0))
+
+    return await asyncio.get_running_loop().run_in_executor(dictionary_executor, find)
+
+
 def meaning_to_string(meanings: list[dict], num: int = 3) -> str:
     """
     Converts a list of meanings to a string for sending
@@ -120,51 +317,160 @@ def remove_romaji_long_vowels(romaji: str) -> str:
             .replace('ou', 'o').replace('ei', 'e'))
 
 
-def romaji_to_kana(word: str, dictionary: dict[str, str], small_tsu: str) -> str:
+def romaji_key(romaji: str) -> str:
+    """
+    Converts romaji to the key it is indexed by in the local dictionary, with long vowels removed, so the spellings of
+    a reading with and without long vowels share the same key.
+
+    :param romaji: Romaji string
+    :return: Romaji key
+    """
+    return remove_romaji_long_vowels(romaji)
+
+
+def spelling_key(word: str) -> str:
+    """
+    Converts a written word to the key it is indexed by in the local dictionary, with the okurigana removed, so
+    spellings differing only in okurigana share the same key.
+
+    :param word: Written word
+    :return: Spelling key, or an empty string if the word is all hiragana
+    """
+    return ''.join(c for c in word if c not in set_hira)
+
+
+def matches_okurigana(word: str, reading: str) -> bool:
     """
-    Converts a string to a list of possible kana, using a specified dictionary
+    Checks if the kana of a written word line up, in order, with a reading, each run of other characters standing for
+    at least one kana of the reading. Spellings found by their spelling key only agree on the kanji, so this tells a
+    different okurigana spelling of a word, such as 引っ越し for ひっこし, from a word followed by unrelated kana.
+
+    :param word: Written word
+    :param reading: Reading of a spelling of the word
+    :return: Whether the word can be read as the reading
+    """
+    pattern = ''.join(re.escape(hiragana_to_katakana(''.join(run))) if is_kana else '.+'
+                      for is_kana, run in groupby(word, lambda c: c in set_hira))
+    return re.fullmatch(pattern, hiragana_to_katakana(reading)) is not None
+
+
+def build_romaji_trie(dictionary: dict[str, str]) -> dict:
+    """
+    Builds a trie of the romaji in a romaji to kana dictionary, for parsing romaji in one pass. Each node maps a letter
+    to the next node, and nodes ending a romaji map the empty string to its kana.
+
+    :param dictionary: Romaji to kana dictionary
+    :return: Root of the trie
+    """
+    root = {}
+    for romaji, kana in dictionary.items():
+        node = root
+        for c in romaji:
+            node = node.setdefault(c, {})
+        node[''] = kana
+    return root
+
+
+def romaji_to_kana(word: str, trie: dict, small_tsu: str) -> str:
+    """
+    Converts a string to kana by greedily matching the longest romaji in the trie at each position
 
     :param small_tsu: Small tsu to use
-    :param dictionary: The dictionary to use
+    :param trie: Trie of the romaji to kana dictionary to use, from build_romaji_trie
     :param word: The word to convert
-    :return: All possible kana parsings of the word with the dictionary
+    :return: The kana parsing of the word, or an empty string if the word cannot be parsed
     """
-    i = 0
-    kana_word = ""
-    for j in range(min(3, len(word) - i), 0, -1):
-        if word[i:i + j] in dictionary:
-            kana_word += dictionary[word[i:i + j]]
-            i += j
-            break
+    def longest_match(start: int) -> tuple[str, int]:
+        node = trie
+        match, length = '', 0
+        for j in range(start, len(word)):
+            node = node.get(word[j])
+            if node is None:
+                break
+            if '' in node:
+                match, length = node[''], j - start + 1
+        return match, length
+
+    kana, i = longest_match(0)
+    kana = [kana]
     while i < len(word):
         if i + 1 < len(word) and word[i] == word[i + 1] and word[i] != 'n':
-            kana_word += small_tsu
+            kana.append(small_tsu)
             i += 1
-        for j in range(min(3, len(word) - i), 0, -1):
-            if word[i:i + j] in dictionary:
-                kana_word += dictionary[word[i:i + j]]
-                i += j
-                break
-        else:
+        match, length = longest_match(i)
+        if not match:
             return ''
-    return kana_word
+        kana.append(match)
+        i += length
+    return ''.join(kana)
 
 
-def romaji_to_katakana(word: str) -> tuple[list[str], list[str]]:
+def iter_romaji_katakana(word: str, prefix_filter: Callable[[str], bool] | None = None) \
+        -> Iterator[tuple[str, str]]:
     """
-    Converts a string to a list of possible katakana
+    Lazily yields the possible katakana parsings of a romaji string. Each ナ, ニ, ヌ, ネ or ノ could also be ン followed
+    by a vowel, so the parsing without any of these splits is yielded first, followed by every parsing with one split,
+    then every parsing with two, and so on.
+
     :param word: The word to convert
-    :return: All possible katakana parsings of the word
+    :param prefix_filter: Optional check that katakana (without choonpu) is the start of some dictionary word. Splits
+    failing the check are pruned along with every parsing that would continue them.
+    :return: Generator of pairs of the katakana with and without choonpu
     """
-    kata = romaji_to_kana(word, romaji_to_katakana_dict, 'ッ')
+    if len(word) > MAX_ROMAJI_LENGTH:
+        return
+    kata = romaji_to_kana(word, romaji_to_katakana_trie, 'ッ')
     if not kata:
-        return [], []
+        return
+    katakana = fold_long_vowels(kata)
+    positions = [i for i, c in enumerate(kata) if c in n_dict]
 
-    words_no_choonpu = ['']
-    for c in kata:
-        words_n = [w + n_dict[c] for w in words_no_choonpu] if c in 'ナニヌネノ' else []
-        words_no_choonpu = [w + c for w in words_no_choonpu] + words_n
+    checked = {}
 
+    def allowed(split: str) -> bool:
+        if prefix_filter is None:
+            return True
+        if split not in checked:
+            checked[split] = prefix_filter(split)
+        return checked[split]
+
+    def expand(n: int, start: int, prefix: str, prefix_no_choonpu: str, splits: int) -> Iterator[tuple[str, str]]:
+        if n == len(positions):
+            yield prefix + katakana[start:], prefix_no_choonpu + kata[start:]
+            return
+        p = positions[n]
+        prefix += katakana[start:p]
+        prefix_no_choonpu += kata[start:p]
+        if splits < len(positions) - n:
+            yield from expand(n + 1, p + 1, prefix + kata[p], prefix_no_choonpu + kata[p], splits)
+        split = prefix_no_choonpu + n_dict[kata[p]]
+        if splits and allowed(split):
+            yield from expand(n + 1, p + 1, prefix + n_dict[kata[p]], split, splits - 1)
+
+    # Parsings with fewer splits are more likely, so they are yielded first and kept when the parsings are capped
+    for splits in range(len(positions) + 1):
+        yield from expand(0, 0, '', '', splits)
+
+
+def romaji_to_katakana(word: str, prefix_filter: Callable[[str], bool] | None = None) \
+        -> tuple[list[str], list[str]]:
+    """
+    Converts a string to a list of possible katakana, keeping at most MAX_ROMAJI_VARIANTS parsings
+    :param word: The word to convert
+    :param prefix_filter: Optional check that katakana is the start of some dictionary word, see iter_romaji_katakana
+    :return: All possible katakana parsings of the word, with and without choonpu
+    """
+    parsings = list(islice(iter_romaji_katakana(word, prefix_filter), MAX_ROMAJI_VARIANTS))
+    return [k for k, _ in parsings], [k for _, k in parsings]
+
+
+def fold_long_vowels(katakana: str) -> str:
+    """
+    Replaces kana that lengthen the vowel of the previous kana with choonpu, e.g. オオキイ becomes オーキー
+
+    :param katakana: Katakana string
+    :return: Katakana string with long vowels written as choonpu
+    """
     def convert_choonpu(char, next_char):
         if char in set_a and next_char == 'ア' or \
                 char in set_e and (next_char == 'エ' or next_char == 'イ') or \
@@ -176,34 +482,40 @@ def romaji_to_katakana(word: str) -> tuple[list[str], list[str]]:
             return 'ー'
         return next_char
 
-    katakana = ""
-    for i in range(len(kata) - 1, -1, -1):
-        if i == 0:
-            katakana = kata[i] + katakana
-        else:
-            katakana = convert_choonpu(kata[i - 1], kata[i]) + katakana
+    return katakana[:1] + ''.join(convert_choonpu(katakana[i - 1], katakana[i]) for i in range(1, len(katakana)))
+
 
-    words = ['']
-    for c in katakana:
-        words_n = [w + n_dict[c] for w in words] if c in 'ナニヌネノ' else []
-        words = [w + c for w in words] + words_n
+def dictionary_key(term: str) -> str:
+    """
+    Converts a reading to the key it is indexed by in the local dictionary. Hiragana, katakana and romaji spellings of
+    a reading, with or without choonpu, all share the same key.
 
-    return words, words_no_choonpu
+    :param term: Reading in kana or romaji
+    :return: Dictionary key of the reading
+    """
+    if is_romaji(term):
+        kata, _ = next(iter_romaji_katakana(term), ('', ''))
+        return kata
+    return fold_long_vowels(term.translate(hiragana_to_katakana_table))
 
 
-def romaji_to_hira_kata(word: str) -> tuple[list[str], list[str]]:
+@metrics.timed("romaji_to_hira_kata", "Time to convert romaji to kana")
+def romaji_to_hira_kata(word: str, prefix_filter: Callable[[str], bool] | None = None) \
+        -> tuple[list[str], list[str]]:
     """
     Converts a string to a list of possible hiragana and katakana
 
     :param word: The word to convert
+    :param prefix_filter: Optional check that katakana is the start of some dictionary word, see iter_romaji_katakana
     :return: All possible hiragana and katakana parsings of the word
     """
-    kata, kata_no_choonpu = romaji_to_katakana(word)
+    kata, kata_no_choonpu = romaji_to_katakana(word, prefix_filter)
     hira = [katakana_to_hiragana(k) for k in kata_no_choonpu]
 
     return hira, kata
 
 
+@lru_cache(maxsize=4096)
 def kana_to_romaji(kana: str) -> str:
     """
     Converts a kana string to romaji
@@ -211,38 +523,39 @@ def kana_to_romaji(kana: str) -> str:
     :param kana: Kana string
     :return: Romaji string
     """
-    dictionary = {**hiragana_to_romaji_dict, **katakana_to_romaji_dict}
-    romaji = ""
+    dictionary = kana_to_romaji_dict
+    romaji = []
     i = 0
     while True:
         if i >= len(kana):
             break
         # Check for two character mora (i.e with small kana)
         if kana[i:i + 2] in dictionary:
-            romaji += dictionary[kana[i:i + 2]]
+            romaji.append(dictionary[kana[i:i + 2]])
             i += 2
         # Check for regular kana
         elif kana[i] in dictionary:
-            romaji += dictionary[kana[i]]
+            romaji.append(dictionary[kana[i]])
             i += 1
         # Check for special cases
         elif kana[i] == 'ー':
             if i > 0 and kana[i - 1] in dictionary:
-                romaji += dictionary[kana[i - 1]][-1]
+                romaji.append(dictionary[kana[i - 1]][-1])
             elif i > 0 and kana[i - 2:i] in dictionary:
-                romaji += dictionary[kana[i - 2:i]][-1]
+                romaji.append(dictionary[kana[i - 2:i]][-1])
             i += 1
         elif kana[i] in 'っッ':
             if i + 1 < len(kana) and kana[i + 1] in dictionary:
-                romaji += dictionary[kana[i + 1]][0]
+                romaji.append(dictionary[kana[i + 1]][0])
                 i += 1
             else:
                 return ""
         else:
             return kana
-    return romaji
+    return ''.join(romaji)
 
 
+@lru_cache(maxsize=4096)
 def hiragana_to_katakana(hira: str) -> str:
     """
     Converts a hiragana string to katakana
@@ -250,9 +563,10 @@ def hiragana_to_katakana(hira: str) -> str:
     :param hira: Hiragana string
     :return: Katakana string
     """
-    return ''.join(hiragana_to_katakana_dict.get(c, c) for c in hira)
+    return hira.translate(hiragana_to_katakana_table)
 
 
+@lru_cache(maxsize=4096)
 def katakana_to_hiragana(kata: str) -> str:
     """
     Converts a katakana string to hiragana if possible, otherwise returns an empty string
@@ -260,13 +574,9 @@ def katakana_to_hiragana(kata: str) -> str:
     :param kata: Katakana string
     :return: Hiragana string if possible, otherwise an empty string
     """
-    hira = ""
-    for c in kata:
-        if c in katakana_to_hiragana_dict:
-            hira += katakana_to_hiragana_dict[c]
-        else:
-            return ""
-    return hira
+    if not set_convertible_kata.issuperset(kata):
+        return ""
+    return kata.translate(kata_to_hira_translation)
 
 
 def is_romaji(word: str) -> bool:
@@ -276,7 +586,7 @@ def is_romaji(word: str) -> bool:
     :param word: String to check
     :return: Whether the string is romaji
     """
-    return all(c in set_romaji for c in word)
+    return set_romaji.issuperset(word)
 
 
 def is_kana(word: str) -> bool:
@@ -286,7 +596,7 @@ def is_kana(word: str) -> bool:
     :param word: String to check
     :return: Whether the string is kana
     """
-    return all(c in set_hira.union(set_kata) for c in word)
+    return set_kana.issuperset(word)
 
 
 romaji_to_hiragana_dict: dict[str, str] = {
@@ -355,23 +665,40 @@ romaji_to_katakana_dict: dict[str, str] = {
     'tsa': 'ツァ', 'tsi': 'ツィ', 'tse': 'ツェ', 'tso': 'ツォ'
 }
 
+romaji_to_katakana_trie = build_romaji_trie(romaji_to_katakana_dict)
+
 katakana_to_romaji_dict = {v: k for k, v in romaji_to_katakana_dict.items()}
 hiragana_to_romaji_dict = {v: k for k, v in romaji_to_hiragana_dict.items()}
 hiragana_to_katakana_dict = {**{vh: vk for kk, vk in romaji_to_katakana_dict.items() for
                                 kh, vh in romaji_to_hiragana_dict.items() if kk == kh},
                              **{'ゃ': 'ャ', 'ゅ': 'ュ', 'ょ': 'ョ', 'っ': 'ッ'}}
 katakana_to_hiragana_dict = {v: k for k, v in hiragana_to_katakana_dict.items()}
-
-set_hira = {v[-1] for _, v in romaji_to_hiragana_dict.items()}.union({'っ'})
-set_kata = {v[-1] for _, v in romaji_to_katakana_dict.items()}.union({'ー', 'ッ', 'ヶ', 'ヵ'})
-set_mora = {v for _, v in romaji_to_katakana_dict.items()}
-set_romaji = set("abcdefghijkmnoprstuvwyz")
-
-set_a = {'ア', 'カ', 'サ', 'タ', 'ナ', 'ハ', 'マ', 'ヤ', 'ラ', 'ワ', 'ガ', 'ザ', 'ダ', 'バ', 'パ'}
-set_i = {'イ', 'キ', 'シ', 'チ', 'ニ', 'ヒ', 'ミ', 'リ', 'ギ', 'ジ', 'ヂ', 'ビ', 'ピ', 'ィ'}
-set_u = {'ウ', 'ク', 'ス', 'ツ', 'ヌ', 'フ', 'ム', 'ユ', 'ル', 'グ', 'ズ', 'ヅ', 'ブ', 'プ'}
-set_e = {'エ', 'ケ', 'セ', 'テ', 'ネ', 'ヘ', 'メ', 'レ', 'ゲ', 'ゼ', 'デ', 'ベ', 'ペ', 'ェ'}
-set_o = {'オ', 'コ', 'ソ', 'ト', 'ノ', 'ホ', 'モ', 'ヨ', 'ロ', 'ゴ', 'ゾ', 'ド', 'ボ', 'ポ', 'ォ'}
+kana_to_romaji_dict = {**hiragana_to_romaji_dict, **katakana_to_romaji_dict}
+hiragana_to_katakana_table = {c: c + 0x60 for c in range(ord('ぁ'), ord('ゖ') + 1)}
+kata_to_hira_translation = str.maketrans({k: v for k, v in katakana_to_hiragana_dict.items() if len(k) == 1})
+
+set_hira = frozenset({v[-1] for _, v in romaji_to_hiragana_dict.items()}.union({'っ'}))
+set_kata = frozenset({v[-1] for _, v in romaji_to_katakana_dict.items()}.union({'ー', 'ッ', 'ヶ', 'ヵ'}))
+set_kana = set_hira | set_kata
+set_mora = frozenset({v for _, v in romaji_to_katakana_dict.items()})
+set_romaji = frozenset("abcdefghijkmnoprstuvwyz")
+small_kana = frozenset("ャュョァィェォ")
+set_convertible_kata = frozenset(k for k in katakana_to_hiragana_dict if len(k) == 1)
+
+set_a = frozenset({'ア', 'カ', 'サ', 'タ', 'ナ', 'ハ', 'マ', 'ヤ', 'ラ', 'ワ', 'ガ', 'ザ', 'ダ', 'バ', 'パ'})
+set_i = frozenset({'イ', 'キ', 'シ', 'チ', 'ニ', 'ヒ', 'ミ', 'リ', 'ギ', 'ジ', 'ヂ', 'ビ', 'ピ', 'ィ'})
+set_u = frozenset({'ウ', 'ク', 'ス', 'ツ', 'ヌ', 'フ', 'ム', 'ユ', 'ル', 'グ', 'ズ', 'ヅ', 'ブ', 'プ'})
+set_e = frozenset({'エ', 'ケ', 'セ', 'テ', 'ネ', 'ヘ', 'メ', 'レ', 'ゲ', 'ゼ', 'デ', 'ベ', 'ペ', 'ェ'})
+set_o = frozenset({'オ', 'コ', 'ソ', 'ト', 'ノ', 'ホ', 'モ', 'ヨ', 'ロ', 'ゴ', 'ゾ', 'ド', 'ボ', 'ポ', 'ォ'})
+
+choonpu_to_kana = {**{k: 'ア' for k in set_a},
+                   **{k: 'イ' for k in set_i | set_e},
+                   **{k: 'ウ' for k in set_u | set_o}}
+normal_table = str.maketrans({
+    'ヂ': 'ジ', 'ヅ': 'ズ',
+    'ャ': 'ヤ', 'ュ': 'ユ', 'ョ': 'ヨ',
+    'ァ': 'ア', 'ィ': 'イ', 'ゥ': 'ウ', 'ェ': 'エ', 'ォ': 'オ'
+})
 
 n_dict = {
     'な': 'んあ', 'に': 'んい', 'ぬ': 'んう', 'ね': 'んえ', 'の': 'んお',
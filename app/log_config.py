@@ -0,0 +1,87 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+
+# Attributes every log record has, anything else on a record was passed in extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in every n records of high frequency events, which are logged with extra={'sample': n}. Records are
+    counted per call site, so sampling one event does not thin out another.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counts: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", 1)
+        if sample <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        count = self.counts.get(site, 0)
+        self.counts[site] = count + 1
+        return count % sample == 0
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with the fields passed in extra alongside the message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **{key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES},
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without formatting them, so the message and traceback are formatted by the listener thread. The
+    stock handler formats them on the logging thread and drops exc_info, leaving the structured formatter no exception
+    to format. The arguments of a record are only read when it is formatted, so mutable state such as a dict has to be
+    logged as a copy, or the message may show it as it was after it changed.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+def setup_logging(level: str, structured: bool) -> logging.handlers.QueueListener:
+    """
+    Configure logging so records are only queued by the thread that logs them, and formatted and written by a
+    background thread. Records below the level are dropped before any formatting, and sampled records are thinned out
+    before they are queued.
+
+    :param level: Name of the lowest level to log
+    :param structured: Whether to write JSON lines instead of plain text
+    :return: The listener writing the queued records, which is stopped when the process exits
+    """
+    handler = logging.StreamHandler()
+    if structured:
+        handler.setFormatter(StructuredFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S'))
+
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Awaitable
+
+
+class LookupCache:
+    """
+    Size bounded LRU cache for dictionary lookups. Entries expire after a time to live, with a separate (usually
+    shorter) time to live for lookups that found nothing. Concurrent lookups of the same key share one fetch, which
+    finishes even if the caller that started it is cancelled.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.in_flight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Get the value for a key, fetching it if it is not cached or has expired.
+
+        :param key: Key to look up
+        :param fetch: Function fetching the value of the key
+        :return: The cached or fetched value
+        """
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if key in self.in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.misses += 1
+        task = asyncio.create_task(self.fetch_and_put(key, fetch))
+        # Retrieve the exception in case every caller stopped waiting before the fetch failed
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def fetch_and_put(self, key: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Fetch the value for a key and cache it. This runs in its own task, so a caller that is cancelled stops waiting
+        without cancelling the fetch for the other callers waiting for it.
+
+        :param key: Key to fetch
+        :param fetch: Function fetching the value of the key
+        :return: The fetched value
+        """
+        try:
+            value = await fetch()
+        finally:
+            del self.in_flight[key]
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        """
+        Store a value in the cache, evicting the least recently used entries if the cache is full.
+
+        :param key: Key to store
+        :param value: Value to store
+        :return:
+        """
+        self.entries[key] = (time.monotonic() + (self.ttl if value else self.negative_ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+
+        :return:
+        """
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the counters of the cache, for sizing it.
+
+        :return: Dictionary of the size, hits, misses, evictions and coalesced lookups of the cache
+        """
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'coalesced': self.coalesced}
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 
@@ -7,27 +8,101 @@ from nextcord import SlashOption
 from nextcord.ext import commands
 
 import game_turns
+import kana_conversion
+import metrics
+from cache_warm_up import CacheWarmUp
+from game_journal import GameJournal
 from game_options import *
+from game_registry import GameRegistry, SharedGameStore
 from game_state import GameState
+from log_config import setup_logging
+from message_router import MessageRouter
 from team import Team
 from constants import *
 
 load_dotenv()
 
 intents = nextcord.Intents.all()
-bot = commands.Bot(intents=intents)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+    registry = GameRegistry(MAX_GAMES_PER_CHANNEL, MAX_GAMES_PER_GUILD, MAX_GAMES, SharedGameStore(SHARED_STATE_PATH))
+else:
+    bot = commands.Bot(intents=intents)
+    registry = GameRegistry(MAX_GAMES_PER_CHANNEL, MAX_GAMES_PER_GUILD, MAX_GAMES)
+router = MessageRouter()
+journal = GameJournal(f"{JOURNAL_PATH}.{'-'.join(str(shard) for shard in SHARD_IDS)}" if SHARD_IDS else JOURNAL_PATH,
+                      JOURNAL_FSYNC)
+resumed_games = set()
+warm_up = CacheWarmUp()
 
 logger = logging.getLogger("shiritori-ref")
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+setup_logging(LOG_LEVEL, LOG_STRUCTURED)
+
+
+class ResumedInteraction:
+    """
+    Stand in for the interaction that started a game, for games resumed after a restart. The game only uses the
+    channel and guild of the interaction.
+    """
+
+    def __init__(self, channel: nextcord.abc.Messageable, guild_id: int | None):
+        self.channel = channel
+        self.guild_id = guild_id
 
 
 @bot.event
 async def on_ready():
-    logger.info(f'Logged in as {bot.user}')
+    logger.info(f'Logged in as {bot.user}' + (f' with shards {SHARD_IDS} of {SHARD_COUNT}' if SHARD_COUNT else ''))
+    warm_up.start()
+    for snapshot in journal.take_interrupted_games():
+        task = asyncio.create_task(resume_game(snapshot))
+        resumed_games.add(task)
+        task.add_done_callback(resumed_games.discard)
+    # Each shard process serves its metrics on its own port
+    await metrics.start(METRICS_PORT and METRICS_PORT + (SHARD_IDS[0] if SHARD_IDS else 0))
+
+
+async def resume_game(snapshot: dict) -> None:
+    """
+    Resume a game that was running when the bot stopped.
+
+    :param snapshot: Snapshot of the game from the journal
+    :return:
+    """
+    user_ids = {user_id for team in snapshot['teams'] for user_id in team} | {int(u) for u in snapshot['words']}
+    try:
+        channel = bot.get_channel(snapshot['channel']) or await bot.fetch_channel(snapshot['channel'])
+        users = {user_id: bot.get_user(user_id) or await bot.fetch_user(user_id) for user_id in user_ids}
+    except nextcord.HTTPException as e:
+        logger.warning(f"Could not resume game {snapshot['game']}: {e}")
+        return
+
+    game_state = GameState.from_dict(snapshot, users)
+    logger.info(f"Resuming game {snapshot['game']} in {channel} with streak {game_state.get_streak()}")
+    await channel.send(f"I'm back! Resuming the game with a streak of {game_state.get_streak()}.")
+    await initiate_duel(ResumedInteraction(channel, snapshot['guild']), game_state.teams,
+                        GameJournal.options(snapshot), game_state)
+
+
+@bot.listen('on_message')
+async def route_message(message: nextcord.Message):
+    router.dispatch(message)
+
+
+async def reject_if_busy(inter: nextcord.Interaction) -> bool:
+    """
+    Reject a command starting a game if the bot is still warming up, or no more games can run in the channel.
+
+    :param inter: Interaction object
+    :return: True if the command was rejected
+    """
+    if not warm_up.ready:
+        reason = "I'm still warming up, try again in a minute!"
+    else:
+        reason = await registry.get_rejection_reason(inter.channel.id, inter.guild_id)
+    if reason:
+        await inter.response.send_message(reason, ephemeral=True)
+    return bool(reason)
 
 
 @bot.slash_command(
@@ -46,13 +121,18 @@ async def duel(
                                       required=False, default=InputMode.ROMAJI),
         chat_on: bool = SlashOption(description="Enable chatting during the duel. Start words with \"> \" or \"、\" "
                                                 "to submit in chat mode. Default: true",
-                                    required=False, default=True)
+                                    required=False, default=True),
+        difficulty: str = SlashOption(description="How hard the bot plays, when dueling the bot. "
+                                                  f"Default: {Difficulty.EASY.value}",
+                                      choices=Difficulty.choices(), required=False, default=Difficulty.EASY)
 ) -> None:
     if user == inter.user:
         await inter.response.send_message("You cannot duel yourself!", ephemeral=True)
         return
+    if await reject_if_busy(inter):
+        return
 
-    options = GameOptions(Pace(pace), InputMode(input_mode), chat_on)
+    options = GameOptions(Pace(pace), InputMode(input_mode), chat_on, Difficulty(difficulty))
 
     if user == bot.user:
         await inter.response.send_message("Lets practice Shiritori!")
@@ -84,10 +164,15 @@ async def survive(
                                       required=False, default=InputMode.ROMAJI),
         chat_on: bool = SlashOption(description="Enable chatting during the duel. Start words with \"> \" or \"、\" "
                                                 "to submit in chat mode. Default: on",
-                                    required=False, default=True)
+                                    required=False, default=True),
+        difficulty: str = SlashOption(description="How hard the bot plays, when playing against the bot. "
+                                                  f"Default: {Difficulty.EASY.value}",
+                                      choices=Difficulty.choices(), required=False, default=Difficulty.EASY)
 ) -> None:
+    if await reject_if_busy(inter):
+        return
     players = Team(list(set(bot.parse_mentions(players) + [inter.user])) if players else [inter.user])
-    options = GameOptions(Pace(pace), InputMode(input_mode), chat_on)
+    options = GameOptions(Pace(pace), InputMode(input_mode), chat_on, Difficulty(difficulty))
     if vs_ref:
         await inter.response.send_message("Let's practice shiritori!")
         await initiate_duel(inter, [players, Team([bot.user])], options)
@@ -136,6 +221,8 @@ async def battle(
         return
     all_players.pop(all_players.index(inter.user))
 
+    if await reject_if_busy(inter):
+        return
     options = GameOptions(Pace(pace), InputMode(input_mode), chat_on)
 
     if bot.user in all_players:
@@ -152,8 +239,44 @@ async def battle(
         view=view)
 
 
+@bot.slash_command(
+    name="hint",
+    description="Get a hint for your turn, and how many words are left to play",
+    guild_ids=GUILDS
+)
+async def hint(inter: nextcord.Interaction) -> None:
+    game_state = next((game for game in registry.games.get(inter.channel.id, [])
+                       if any(inter.user in team for team in game.teams)), None)
+    if game_state is None:
+        await inter.response.send_message("You are not playing a game in this channel!", ephemeral=True)
+        return
+    if inter.user not in game_state.current_team:
+        await inter.response.send_message("It is not your turn!", ephemeral=True)
+        return
+    if not game_state.prev_kata:
+        await inter.response.send_message("You can play any word!", ephemeral=True)
+        return
+
+    await inter.response.defer(ephemeral=True)
+    move_counter = await game_turns.get_move_counter(game_state)
+    if move_counter is None:
+        await inter.followup.send("Hints need the local dictionary, which is not installed.", ephemeral=True)
+        return
+
+    remaining, reading, left = await kana_conversion.get_hint(game_state.prev_kata, move_counter)
+    last_kata = game_state.prev_mora[-1]
+    last_hira = kana_conversion.katakana_to_hiragana(last_kata) or last_kata
+    if not reading:
+        await inter.followup.send(f"There are no words left starting with {last_hira}!", ephemeral=True)
+        return
+    await inter.followup.send(
+        f"There are {remaining} words left starting with {last_hira}.\n"
+        f"Try {reading} ({kana_conversion.kana_to_romaji(reading)}), which leaves {left} words to follow it.",
+        ephemeral=True)
+
+
 async def initiate_duel(
-        inter: nextcord.Interaction, teams: list[Team], options: GameOptions
+        inter: nextcord.Interaction, teams: list[Team], options: GameOptions, game_state: GameState = None
 ) -> None:
     """
     Initiates a duel or battle.
@@ -161,72 +284,31 @@ async def initiate_duel(
     :param inter: Interaction object
     :param teams: List of teams
     :param options: Game options
+    :param game_state: State of a game to resume, a new game is started if not given
     :return:
     """
-    if bot.user not in [u for team in teams for u in team.players]:
-        await inter.channel.send(f"{teams[0].to_string()},"
-                                 f" as the challenged, you have the right of the first word.")
-    game_state = GameState(teams)
+    game_state = game_state or GameState(teams)
+    reason = await registry.add(inter.channel.id, inter.guild_id, game_state)
+    if reason:
+        await inter.channel.send(reason)
+        return
+    journal.start(game_state, inter.channel.id, inter.guild_id, bot.user.id, options)
 
     async def wait_for_user_input(check) -> nextcord.Message:
-        return await bot.wait_for(
-            'message', timeout=TIME_SPEED if options.pace == Pace.SPEED else TIME_NORMAL, check=check)
-
-    while True:
-        logger.info(
-            f"Streak {game_state.get_streak()}, Lives: {game_state.lives}, Words played: {game_state.num_words_played}")
-        current_id = game_state.current_team.id
-
-        if game_state.lives[current_id] <= 0:
-            await inter.channel.send(
-                f"{game_state.current_team.to_string()} {'have' if len(game_state.current_team) > 1 else 'has'}"
-                f" lost all their lives. ")
-            finished = game_state.knockout_team()
-            if finished:
-                await inter.channel.send(f"{game_state.current_team.to_string(mention=True)} has won!")
-                break
-
-        # Bot's turn
-        if bot.user in game_state.current_team:
-            (played_kata, played_kanji) = await game_turns.take_bot_turn(inter, game_state)
-            logger.info(f"Bot played {played_kata}")
-            if played_kata:
-                game_state.prev_kata = played_kata
-                game_state.prev_kanji = played_kanji
-                game_state.played_words.add(played_kata)
-                game_state.current_team = teams[(teams.index(game_state.current_team) + 1) % len(teams)]
-                game_state.num_words_played[bot.user] += 1
-                continue
-            else:
-                break
-
-        await game_state.announce_streak(inter)
-
-        # User's turn
-        (is_alive, played_kata, played_kanji, player) = await game_turns.take_user_turn(
-            inter, options, game_state, wait_for_user_input
-        )
-
-        if not is_alive:
-            finished = game_state.knockout_team()
-            if finished:
-                await inter.channel.send(f"{game_state.current_team.to_string(mention=True)} has won!")
-                break
-            continue
-        if not played_kata:
-            continue
-
-        game_state.prev_kata = played_kata
-        game_state.prev_kanji = played_kanji
-        game_state.played_words.add(played_kata)
-        game_state.current_team = teams[(teams.index(game_state.current_team) + 1) % len(teams)]
-        game_state.num_words_played[player] += 1
-
-    # The game has ended
-    await inter.channel.send(
-        f"The final streak was {game_state.get_streak()}!\n" +
-        "\n".join([f"{user.global_name or user.display_name} played {num} words"
-                   for user, num in game_state.num_words_played.items()]))
+        return await router.wait_for(
+            inter.channel.id, {user.id for user in game_state.current_team.players}, check,
+            timeout=TIME_SPEED if options.pace == Pace.SPEED else TIME_NORMAL)
+
+    try:
+        await game_turns.play_game(inter, teams, options, bot.user, wait_for_user_input, game_state)
+        journal.end(game_state)
+    # Games cancelled by the bot shutting down are left in the journal, to be resumed on restart
+    except Exception:
+        journal.end(game_state)
+        raise
+    finally:
+        await registry.remove(inter.channel.id, inter.guild_id, game_state)
+        logger.info(f"Games running: {await registry.stats()}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+
+import nextcord
+
+import metrics
+from constants import CHANNEL_RATE_LIMIT, CHANNEL_RATE_PERIOD, MESSAGE_LIMIT
+
+logger = logging.getLogger("shiritori-ref")
+
+
+class RateLimiter:
+    """
+    Allows at most rate sends in any period of seconds, matching Discord's per channel message rate limit. A rate of
+    0 disables the limit.
+    """
+
+    def __init__(self, rate: int, period: float):
+        self.rate = rate
+        self.period = period
+        self.sent = deque()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a message can be sent, and count it as sent.
+
+        :return:
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            while self.sent and now - self.sent[0] >= self.period:
+                self.sent.popleft()
+            if len(self.sent) < self.rate:
+                self.sent.append(now)
+                return
+            await asyncio.sleep(self.period - (now - self.sent[0]))
+
+
+# Rate limiters of the channels with games running, shared by every game in a channel
+rate_limiters: weakref.WeakValueDictionary[int, RateLimiter] = weakref.WeakValueDictionary()
+
+
+class MessageOutbox:
+    """
+    Outbound messages of a game. Messages sent during a turn are buffered and coalesced into as few Discord messages as
+    possible when the outbox is flushed, which the game does before waiting for a player. The messages are then sent in
+    order by a background task, within the rate limit of the channel, so the game does not wait for Discord.
+    """
+
+    def __init__(self, channel: nextcord.abc.Messageable):
+        self.channel = channel
+        self.id = channel.id
+        self.rate_limiter = rate_limiters.setdefault(channel.id, RateLimiter(CHANNEL_RATE_LIMIT, CHANNEL_RATE_PERIOD))
+        self.buffer: list[str] = []
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.sender = None
+        self.requests = 0
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        """
+        Buffer a message. Messages with anything but content, such as an embed or a view, are queued on their own
+        after the buffered messages.
+
+        :param content: Content of the message
+        :param kwargs: Other arguments of the message
+        :return:
+        """
+        if kwargs:
+            self.flush()
+            self.put(content, kwargs)
+        elif content:
+            self.buffer.append(str(content))
+
+    def flush(self) -> None:
+        """
+        Queue the buffered messages, joined into as few messages as fit in Discord's message length limit.
+
+        :return:
+        """
+        message = ""
+        for content in self.buffer:
+            for line in [content[i:i + MESSAGE_LIMIT] for i in range(0, len(content), MESSAGE_LIMIT)]:
+                if message and len(message) + 1 + len(line) > MESSAGE_LIMIT:
+                    self.put(message, {})
+                    message = ""
+                message = f"{message}\n{line}" if message else line
+        if message:
+            self.put(message, {})
+        self.buffer.clear()
+
+    def put(self, content: str | None, kwargs: dict) -> None:
+        """
+        Queue a message to be sent, starting the background task on the first message.
+
+        :param content: Content of the message
+        :param kwargs: Other arguments of the message
+        :return:
+        """
+        if self.sender is None:
+            self.sender = asyncio.create_task(self.send_queued())
+        self.queue.put_nowait((content, kwargs))
+
+    async def send_queued(self) -> None:
+        """
+        Send the queued messages in order until the outbox is closed. A message that fails to send is logged and
+        skipped, so the messages after it are still sent.
+
+        :return:
+        """
+        while (message := await self.queue.get()) is not None:
+            content, kwargs = message
+            await self.rate_limiter.acquire()
+            self.requests += 1
+            try:
+                await self.send_now(content, kwargs)
+            except nextcord.HTTPException as e:
+                logger.warning(f"Could not send message to {self.channel}: {e}")
+            except Exception:
+                logger.exception(f"Unexpected error sending message to {self.channel}")
+
+    @metrics.timed("channel_send", "Time to send a message to Discord")
+    async def send_now(self, content: str | None, kwargs: dict) -> None:
+        """
+        Send a message to the channel.
+
+        :param content: Content of the message
+        :param kwargs: Other arguments of the message
+        :return:
+        """
+        await self.channel.send(content, **kwargs)
+
+    async def close(self) -> None:
+        """
+        Send every remaining message, and stop the background task.
+
+        :return:
+        """
+        self.flush()
+        if self.sender is not None:
+            self.queue.put_nowait(None)
+            await self.sender
+
+
+class OutboxInteraction:
+    """
+    Stand in for an interaction, whose channel is replaced by the outbox of the game.
+    """
+
+    def __init__(self, inter: nextcord.Interaction, outbox: MessageOutbox):
+        self.inter = inter
+        self.channel = outbox
+
+    def __getattr__(self, name: str):
+        return getattr(self.inter, name)
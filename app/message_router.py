@@ -0,0 +1,82 @@
+import asyncio
+from typing import Callable
+
+import nextcord
+
+
+class Waiter:
+    """
+    A game waiting for a message from one of a set of users in a channel.
+    """
+
+    def __init__(self, user_ids: set[int], check: Callable[[nextcord.Message], bool], future: asyncio.Future):
+        self.user_ids = user_ids
+        self.check = check
+        self.future = future
+
+
+class MessageRouter:
+    """
+    Routes incoming messages to the games waiting for them. Waiters are indexed by channel id and author id, so a
+    message is only checked against the games waiting in its channel for its author, rather than every game.
+    """
+
+    def __init__(self):
+        self.waiters: dict[int, dict[int, list[Waiter]]] = {}
+
+    async def wait_for(self, channel_id: int, user_ids: set[int], check: Callable[[nextcord.Message], bool],
+                       timeout: float) -> nextcord.Message:
+        """
+        Wait for a message in a channel from one of the users that passes the check.
+
+        :param channel_id: Id of the channel to wait in
+        :param user_ids: Ids of the users who may send the message
+        :param check: Check the message must pass
+        :param timeout: Time in seconds to wait before raising asyncio.TimeoutError
+        :return: The message
+        """
+        waiter = Waiter(user_ids, check, asyncio.get_running_loop().create_future())
+        channel = self.waiters.setdefault(channel_id, {})
+        for user_id in user_ids:
+            channel.setdefault(user_id, []).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter.future, timeout)
+        finally:
+            self.remove(channel_id, waiter)
+
+    def remove(self, channel_id: int, waiter: Waiter) -> None:
+        """
+        Stop routing messages to a waiter.
+
+        :param channel_id: Id of the channel the waiter is waiting in
+        :param waiter: Waiter to remove
+        :return:
+        """
+        channel = self.waiters.get(channel_id, {})
+        for user_id in waiter.user_ids:
+            waiters = channel.get(user_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                channel.pop(user_id, None)
+        if not channel:
+            self.waiters.pop(channel_id, None)
+
+    def dispatch(self, message: nextcord.Message) -> bool:
+        """
+        Route a message to the first waiter in its channel for its author that accepts it.
+
+        :param message: Incoming message
+        :return: Whether a waiter accepted the message
+        """
+        channel = self.waiters.get(message.channel.id)
+        if not channel:
+            return False
+        for waiter in channel.get(message.author.id, []):
+            if not waiter.future.done() and waiter.check(message):
+                waiter.future.set_result(message)
+                return True
+        return False
+
+    def __len__(self):
+        return len({waiter for channel in self.waiters.values() for waiters in channel.values() for waiter in waiters})
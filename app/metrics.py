@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from constants import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_LOG_INTERVAL
+
+logger = logging.getLogger("shiritori-ref")
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+
+class Histogram:
+    """
+    Counts observed durations in fixed buckets, like a Prometheus histogram. Durations can be observed from the
+    dictionary threads as well as the event loop, so the counts are updated and read under a lock.
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """
+        Record a duration.
+
+        :param seconds: Duration in seconds
+        :return:
+        """
+        with self.lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the observed durations as the upper bound of the bucket it falls in.
+
+        :param q: Quantile between 0 and 1
+        :return: Estimated duration in seconds
+        """
+        with self.lock:
+            rank = q * self.count
+            counts = list(self.counts)
+        total = 0
+        for bound, count in zip(self.buckets, counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_prometheus(self) -> str:
+        """
+        Format the histogram in the Prometheus text format.
+
+        :return: Lines of the histogram
+        """
+        metric = f"shiritori_{self.name}_seconds"
+        lines = [f"# HELP {metric} {self.description}", f"# TYPE {metric} histogram"]
+        with self.lock:
+            counts, seconds, observed = list(self.counts), self.sum, self.count
+        total = 0
+        for bound, count in zip(self.buckets, counts):
+            total += count
+            lines.append(f'{metric}_bucket{{le="{"+Inf" if bound == float("inf") else bound}"}} {total}')
+        lines.append(f"{metric}_sum {seconds}")
+        lines.append(f"{metric}_count {observed}")
+        return "\n".join(lines)
+
+
+histograms: dict[str, Histogram] = {}
+exporters: list[asyncio.Server | asyncio.Task] = []
+
+
+def histogram(name: str, description: str) -> Histogram:
+    """
+    Get a histogram by name, creating it if it does not exist yet.
+
+    :param name: Name of the histogram
+    :param description: Description of what the histogram measures
+    :return: The histogram
+    """
+    if name not in histograms:
+        histograms[name] = Histogram(name, description)
+    return histograms[name]
+
+
+def timed(name: str, description: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function or coroutine function to record how long each call takes. When metrics are disabled, the
+    function is returned unchanged, so the decorator costs nothing.
+
+    :param name: Name of the histogram
+    :param description: Description of what the histogram measures
+    :return: Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+        observe = histogram(name, description).observe
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_coroutine(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start)
+            return timed_coroutine
+
+        @functools.wraps(func)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start)
+        return timed_function
+
+    return decorator
+
+
+def to_prometheus() -> str:
+    """
+    Format every histogram in the Prometheus text format.
+
+    :return: Text of the metrics
+    """
+    return "\n".join(h.to_prometheus() for h in histograms.values()) + "\n"
+
+
+def summary() -> str:
+    """
+    Summarise every histogram in one line each, for the log.
+
+    :return: Summary of the metrics
+    """
+    return "\n".join(f"{h.name}: count={h.count} mean={h.sum / h.count * 1000:.1f}ms "
+                     f"p50<={h.quantile(0.5) * 1000:g}ms p99<={h.quantile(0.99) * 1000:g}ms"
+                     for h in histograms.values() if h.count)
+
+
+async def serve(host: str, port: int) -> asyncio.Server:
+    """
+    Serve the metrics in the Prometheus text format over HTTP, for a Prometheus server to scrape.
+
+    :param host: Host to listen on
+    :param port: Port to listen on
+    :return: The server
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # Every path serves the metrics, so only the request headers need reading
+            while (await reader.readline()).strip():
+                pass
+            body = to_prometheus().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+async def log_periodically(interval: float) -> None:
+    """
+    Log a summary of the metrics every interval.
+
+    :param interval: Time in seconds between summaries
+    :return:
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if histograms:
+            logger.info(f"Metrics:\n{summary()}")
+
+
+async def start(port: int = METRICS_PORT, log_interval: float = METRICS_LOG_INTERVAL) -> None:
+    """
+    Start exporting the metrics, if they are enabled and not exported yet.
+
+    :param port: Port to serve the metrics on, or 0 to not serve them
+    :param log_interval: Time in seconds between summaries in the log, or 0 to not log them
+    :return:
+    """
+    if not METRICS_ENABLED or exporters:
+        return
+    if port:
+        exporters.append(await serve(METRICS_HOST, port))
+    if log_interval:
+        exporters.append(asyncio.create_task(log_periodically(log_interval)))
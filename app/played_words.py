@@ -0,0 +1,66 @@
+from array import array
+from typing import Iterable, Iterator
+
+# Katakana of every word played in any game of this process, and their ids, shared so each game only stores ids
+word_ids: dict[str, int] = {}
+words: list[str] = []
+
+
+def intern_word(kata: str) -> int:
+    """
+    Get the id of a word, giving it a new id if it has not been played in this process before.
+
+    :param kata: Katakana of the word
+    :return: Id of the word
+    """
+    word_id = word_ids.get(kata)
+    if word_id is None:
+        word_id = word_ids[kata] = len(words)
+        words.append(kata)
+    return word_id
+
+
+class PlayedWords:
+    """
+    The words played in a game, in the order they were played. Words are stored as ids into a table shared by every
+    game, so a long streak costs a few bytes per word rather than a string per word.
+    """
+
+    __slots__ = ('ids', 'history')
+
+    def __init__(self, played: Iterable[str] = ()):
+        self.ids: set[int] = set()
+        self.history = array('I')
+        for kata in played:
+            self.add(kata)
+
+    def add(self, kata: str) -> None:
+        """
+        Record a word as played.
+
+        :param kata: Katakana of the word
+        :return:
+        """
+        word_id = intern_word(kata)
+        if word_id not in self.ids:
+            self.ids.add(word_id)
+            self.history.append(word_id)
+
+    def since(self, count: int) -> Iterator[str]:
+        """
+        Iterate over the words played after the first words.
+
+        :param count: Number of words to skip
+        :return: Iterator of the katakana of the words, in the order they were played
+        """
+        return (words[word_id] for word_id in self.history[count:])
+
+    def __contains__(self, kata: str) -> bool:
+        word_id = word_ids.get(kata)
+        return word_id is not None and word_id in self.ids
+
+    def __iter__(self) -> Iterator[str]:
+        return (words[word_id] for word_id in self.history)
+
+    def __len__(self):
+        return len(self.history)
@@ -0,0 +1,49 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+
+def shard_ids(shard_count: int, processes: int) -> list[list[int]]:
+    """
+    Split the shards between processes as evenly as possible.
+
+    :param shard_count: Total number of shards
+    :param processes: Number of processes
+    :return: List of the shard ids of each process
+    """
+    return [list(range(i, shard_count, processes)) for i in range(processes)]
+
+
+def launch(shard_count: int, processes: int) -> int:
+    """
+    Run the bot as several processes, each connecting a subset of the Discord gateway shards. The processes share the
+    lookup cache and the running game count through SQLite files in the working directory, which the processes inherit.
+
+    :param shard_count: Total number of shards
+    :param processes: Number of processes
+    :return: Exit code of the first process to fail, or 0
+    """
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    children = []
+    for ids in shard_ids(shard_count, processes):
+        env = {**os.environ, 'SHARD_COUNT': str(shard_count), 'SHARD_IDS': ",".join(str(i) for i in ids)}
+        children.append(subprocess.Popen([sys.executable, main], env=env))
+
+    def stop(signum, frame):
+        for child in children:
+            child.send_signal(signum)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    codes = [child.wait() for child in children]
+    return next((code for code in codes if code), 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the bot as several sharded processes")
+    parser.add_argument("--shards", type=int, default=os.cpu_count(), help="Total number of gateway shards")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of bot processes")
+    args = parser.parse_args()
+    sys.exit(launch(args.shards, min(args.processes, args.shards)))
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import dictionary
+import game_turns
+from cache_warm_up import CacheWarmUp
+import kana_conversion
+import message_outbox
+from constants import MESSAGE_BEGIN, END_DUEL
+from game_options import GameOptions, Pace, InputMode
+from game_state import GameState
+from team import Team
+
+logger = logging.getLogger("shiritori-ref")
+
+SIMULATED_KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわがぎぐげござじずぜぞだでどばびぶべぼぱぴぷぺぽ"
+
+
+class FakeUser:
+    """
+    Stand in for a Discord user.
+    """
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.global_name = f"player{user_id}"
+        self.display_name = self.global_name
+        self.mention = f"<@{user_id}>"
+
+
+class FakeChannel:
+    """
+    Stand in for a Discord channel, counting the messages sent to it.
+    """
+
+    def __init__(self, channel_id: int = 0):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.sent += 1
+
+
+class FakeMessage:
+    """
+    Stand in for a Discord message.
+    """
+
+    def __init__(self, content: str, author: FakeUser, channel: FakeChannel):
+        self.content = content
+        self.author = author
+        self.channel = channel
+
+
+class FakeInteraction:
+    """
+    Stand in for a Discord interaction, which the game only uses for its channel.
+    """
+
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+
+def build_stub_dictionary(path: str, num_words: int, seed: int = 0) -> None:
+    """
+    Builds a local dictionary of random kana words, so simulated games need neither JMdict nor the network.
+
+    :param path: Path of the local dictionary to write
+    :param num_words: Number of words to generate
+    :param seed: Random seed
+    :return:
+    """
+    rng = random.Random(seed)
+    readings = {''.join(rng.choices(SIMULATED_KANA, k=rng.randint(2, 4))) for _ in range(num_words)}
+    connection = sqlite3.connect(path)
+    connection.executescript(dictionary.SCHEMA)
+    for entry_id, reading in enumerate(readings):
+        connection.execute("INSERT INTO entries VALUES (?, ?, ?)", (entry_id, json.dumps([reading]), 0))
+        connection.execute("INSERT INTO forms VALUES (?, ?, ?, ?)",
+                           (entry_id, None, reading, kana_conversion.dictionary_key(reading)))
+    dictionary.build_indexes(connection)
+    connection.commit()
+    connection.close()
+
+
+class SimulatedGame:
+    """
+    A game played by simulated players, who answer with a random unplayed word unless they make a deliberate mistake.
+    """
+
+    def __init__(self, game_id: int, num_players: int, vs_bot: bool, bot_user: FakeUser, max_turns: int,
+                 mistake_rate: float, think_time: float):
+        self.channel = FakeChannel(game_id)
+        self.players = [FakeUser(game_id * 100 + i + 1) for i in range(num_players)]
+        self.teams = [Team([player]) for player in self.players] + ([Team([bot_user])] if vs_bot else [])
+        self.bot_user = bot_user
+        self.game_state = GameState(self.teams)
+        self.max_turns = max_turns
+        self.mistake_rate = mistake_rate
+        self.think_time = think_time
+        self.turns = 0
+        self.answered_at = None
+        self.latencies = []
+
+    async def wait_for_user_input(self, check) -> FakeMessage:
+        now = time.perf_counter()
+        if self.answered_at is not None:
+            self.latencies.append(now - self.answered_at)
+        if self.think_time:
+            await asyncio.sleep(random.uniform(0, self.think_time))
+
+        self.turns += 1
+        if self.turns > self.max_turns:
+            answer = END_DUEL
+        elif random.random() < self.mistake_rate:
+            answer = "ん" + random.choice(SIMULATED_KANA)
+        else:
+            prev_kata = self.game_state.prev_kata or kana_conversion.hiragana_to_katakana(random.choice(SIMULATED_KANA))
+            answer = await kana_conversion.get_unplayed_word_starting_with(prev_kata, self.game_state.played_words)
+            answer = answer or END_DUEL
+
+        message = FakeMessage(MESSAGE_BEGIN[0] + answer, random.choice(self.game_state.current_team.players),
+                              self.channel)
+        assert check(message)
+        self.answered_at = time.perf_counter()
+        return message
+
+    async def play(self) -> None:
+        options = GameOptions(Pace.NORMAL, InputMode.KANA, True)
+        await game_turns.play_game(FakeInteraction(self.channel), self.teams, options, self.bot_user,
+                                   self.wait_for_user_input, self.game_state)
+
+
+async def simulate(num_games: int, num_players: int, vs_bot: bool, max_turns: int, mistake_rate: float,
+                   think_time: float, measure_memory: bool, warm_up: bool = False) -> dict:
+    """
+    Plays many simulated games concurrently and measures how the engine copes.
+
+    :param num_games: Number of concurrent games
+    :param num_players: Number of simulated players in each game
+    :param vs_bot: Whether the bot plays in each game
+    :param max_turns: Number of player turns before the players end a game
+    :param mistake_rate: Chance of a player answering with an invalid word
+    :param think_time: Maximum time in seconds players think before answering
+    :param measure_memory: Whether to trace memory allocations, which slows the games down
+    :param warm_up: Whether to warm up the caches before the games start
+    :return: Dictionary of the results
+    """
+    warm_up_start = time.perf_counter()
+    if warm_up:
+        await CacheWarmUp(True).run()
+    warm_up_elapsed = time.perf_counter() - warm_up_start
+
+    bot_user = FakeUser(0)
+    games = [SimulatedGame(i + 1, num_players, vs_bot, bot_user, max_turns, mistake_rate, think_time)
+             for i in range(num_games)]
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*[game.play() for game in games])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else 0
+    tracemalloc.stop()
+
+    latencies = sorted(latency for game in games for latency in game.latencies)
+    words = sum(game.game_state.get_streak() for game in games)
+    messages = sum(game.channel.sent for game in games)
+    return {
+        'games': num_games,
+        'seconds': elapsed,
+        'warm_up_seconds': warm_up_elapsed,
+        'words': words,
+        'words_per_second': words / elapsed,
+        'messages_per_word': messages / max(words, 1),
+        'p50_turn_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p99_turn_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'mean_turn_ms': statistics.mean(latencies) * 1000 if latencies else 0,
+        'peak_memory_per_game_kb': peak / num_games / 1024,
+        'lookup_cache': kana_conversion.lookup_cache.stats(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the game engine with simulated games")
+    parser.add_argument("--games", type=int, default=1000, help="Number of concurrent games")
+    parser.add_argument("--players", type=int, default=1, help="Number of simulated players in each game")
+    parser.add_argument("--no-bot", action="store_true", help="Play without the bot")
+    parser.add_argument("--max-turns", type=int, default=50, help="Number of player turns before a game is ended")
+    parser.add_argument("--mistake-rate", type=float, default=0.05, help="Chance of a player answering wrongly")
+    parser.add_argument("--think-time", type=float, default=0, help="Maximum player think time in seconds")
+    parser.add_argument("--words", type=int, default=50000, help="Number of words in the stub dictionary")
+    parser.add_argument("--memory", action="store_true", help="Measure memory per game")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep to Discord's per channel message rate limit")
+    parser.add_argument("--warm-up", action="store_true", help="Warm up the caches before the games start")
+    args = parser.parse_args()
+
+    if not args.rate_limit:
+        message_outbox.CHANNEL_RATE_LIMIT = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        stub_path = os.path.join(directory, "stub.sqlite")
+        build_stub_dictionary(stub_path, args.words)
+        kana_conversion.dictionary_backend = dictionary.LocalDictionary(stub_path)
+        results = asyncio.run(simulate(args.games, args.players, not args.no_bot, args.max_turns,
+                                       args.mistake_rate, args.think_time, args.memory, args.warm_up))
+    print(json.dumps(results, indent=2))
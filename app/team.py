@@ -2,6 +2,8 @@ import nextcord
 
 
 class Team:
+    __slots__ = ('players', 'leader', 'id')
+
     def __init__(self, players: list[nextcord.User]):
         self.players = players
         self.leader = players[0]
@@ -0,0 +1,53 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import dictionary
+import kana_conversion
+
+
+@pytest.mark.parametrize("word, reading", [
+    ("引っ越し", "ひっこし"),
+    ("引越し", "ひっこし"),
+    ("引越", "ひっこし"),
+    ("大い", "おおきい"),
+    ("しりとり", "しりとり"),
+])
+def test_search_word_finds_spellings(local_dictionary, word, reading):
+    assert list(local_dictionary.search_word(word)) == [reading]
+
+
+@pytest.mark.parametrize("word", ["猫ですね", "猫あいうえお", "犬"])
+def test_search_word_rejects_other_words(local_dictionary, word):
+    assert local_dictionary.search_word(word) == {}
+
+
+@pytest.mark.parametrize("word, reading, matches", [
+    ("引越", "ひっこし", True),
+    ("引越し", "ひっこし", True),
+    ("引っ越し", "ひっこし", True),
+    ("大い", "おおきい", True),
+    ("大きい", "おおきい", True),
+    ("猫ですね", "ねこ", False),
+    ("猫", "ねこ", True),
+    ("引越さ", "ひっこし", False),
+])
+def test_matches_okurigana(word, reading, matches):
+    assert kana_conversion.matches_okurigana(word, reading) is matches
+
+
+def test_mora_index_matches_playable_moves(local_dictionary, tmp_path):
+    expected = {}
+    for word_id, first_mora, _ in dictionary.playable_moves(local_dictionary.connection):
+        expected.setdefault(first_mora, []).append(word_id)
+    index = dictionary.MoraIndex(dictionary.LocalDictionary(local_dictionary.path))
+    assert {mora: list(words) for mora, words in index.words.items()} == expected
+
+    # Dictionaries built before the moves table existed are indexed from their forms
+    path = str(tmp_path / "old.sqlite")
+    shutil.copy(local_dictionary.path, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("DROP TABLE moves")
+    old_index = dictionary.MoraIndex(dictionary.LocalDictionary(path))
+    assert {mora: list(words) for mora, words in old_index.words.items()} == expected
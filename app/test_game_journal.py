@@ -0,0 +1,121 @@
+import asyncio
+
+from game_journal import GameJournal
+from game_options import GameOptions, Pace, InputMode, Difficulty
+from game_state import GameState
+from team import Team
+
+
+class User:
+    """
+    Stand in for a Discord user, with the attributes a game uses.
+    """
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.global_name = f"user{user_id}"
+        self.display_name = self.global_name
+
+
+class Channel:
+    async def send(self, content: str = None, **kwargs) -> None:
+        pass
+
+
+class Interaction:
+    channel = Channel()
+
+
+users = {user_id: User(user_id) for user_id in (1, 2, 3)}
+options = GameOptions(Pace.SPEED, InputMode.KANA, True, Difficulty.HARD)
+
+
+def start_game(journal: GameJournal) -> GameState:
+    game_state = GameState([Team([users[1]]), Team([users[2], users[3]])])
+    journal.start(game_state, 10, 20, 99, options)
+    return game_state
+
+
+def test_resumed_game_matches_interrupted_game(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = GameJournal(path)
+    game_state = start_game(journal)
+    game_state.play_word("シリトリ", "尻取り", users[1])
+    game_state.play_word("リンゴ", "林檎", users[2])
+    asyncio.run(game_state.lose_life("Too slow!", Interaction()))
+    game_state.play_word("ゴリラ", "ゴリラ", users[1])
+    journal.file.close()
+
+    snapshots = GameJournal(path).take_interrupted_games()
+    assert len(snapshots) == 1
+    snapshot = snapshots[0]
+    assert (snapshot['channel'], snapshot['guild'], snapshot['bot']) == (10, 20, 99)
+    resumed = GameState.from_dict(snapshot, users)
+    assert resumed.to_dict() == game_state.to_dict()
+    assert resumed.prev_mora == game_state.prev_mora
+    assert list(resumed.played_words) == ["シリトリ", "リンゴ", "ゴリラ"]
+    options_resumed = GameJournal.options(snapshot)
+    assert (options_resumed.pace, options_resumed.input_mode, options_resumed.chat_on,
+            options_resumed.difficulty) == (options.pace, options.input_mode, options.chat_on, options.difficulty)
+
+
+def test_knockout_is_replayed(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = GameJournal(path)
+    game_state = GameState([Team([users[1]]), Team([users[2]]), Team([users[3]])])
+    journal.start(game_state, 10, None, 99, options)
+    game_state.knockout_team()
+    journal.file.close()
+
+    resumed = GameState.from_dict(GameJournal(path).take_interrupted_games()[0], users)
+    assert [team.id for team in resumed.teams] == [2, 3]
+    assert resumed.current_team.id == 2
+
+
+def test_ended_games_are_not_resumed(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = GameJournal(path)
+    ended = start_game(journal)
+    running = start_game(journal)
+    ended.play_word("シリトリ", "尻取り", users[1])
+    journal.end(ended)
+    journal.file.close()
+
+    snapshots = GameJournal(path).take_interrupted_games()
+    assert [snapshot['game'] for snapshot in snapshots] == [running.journal_id]
+    assert GameJournal(path).take_interrupted_games() == []
+
+
+def test_incomplete_last_record_is_skipped(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = GameJournal(path)
+    game_state = start_game(journal)
+    game_state.play_word("シリトリ", "尻取り", users[1])
+    journal.file.write('{"type": "turn", "kata": "リン')
+    journal.file.close()
+
+    snapshot = GameJournal(path).take_interrupted_games()[0]
+    assert snapshot['played'] == ["シリトリ"]
+
+
+def test_compaction_keeps_running_games(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = GameJournal(path, compact_size=1024)
+    game_state = start_game(journal)
+    for i in range(20):
+        game_state.play_word(f"シリトリ{i}", "", users[1] if i % 2 == 0 else users[2])
+    journal.file.close()
+
+    resumed = GameState.from_dict(GameJournal(path).take_interrupted_games()[0], users)
+    assert resumed.to_dict() == game_state.to_dict()
+
+
+def test_journal_keeps_no_copy_of_the_words_played(tmp_path):
+    journal = GameJournal(str(tmp_path / "journal"))
+    game_state = start_game(journal)
+    game_state.play_word("シリトリ", "尻取り", users[1])
+    assert 'played' not in journal.games[game_state.journal_id]
+    assert journal.snapshots()[0]['played'] == ["シリトリ"]
+    journal.end(game_state)
+    assert journal.snapshots() == []
+    journal.file.close()
@@ -0,0 +1,88 @@
+import asyncio
+
+from game_registry import GameRegistry, SharedGameStore
+
+
+class Game:
+    """
+    Stand in for the state of a game, which the registry only keeps track of.
+    """
+
+
+def test_per_channel_limit():
+    async def run():
+        registry = GameRegistry(1, 5, 10)
+        assert await registry.add(1, 100, Game()) == ""
+        assert await registry.get_rejection_reason(1, 100)
+        assert await registry.add(1, 100, Game())
+        assert await registry.add(2, 100, Game()) == ""
+        assert registry.count() == 2
+
+    asyncio.run(run())
+
+
+def test_per_guild_limit():
+    async def run():
+        registry = GameRegistry(1, 2, 10)
+        assert await registry.add(1, 100, Game()) == ""
+        assert await registry.add(2, 100, Game()) == ""
+        assert await registry.add(3, 100, Game())
+        assert await registry.add(3, 200, Game()) == ""
+        assert await registry.add(4, None, Game()) == ""
+        assert registry.count_guild(100) == 2
+
+    asyncio.run(run())
+
+
+def test_global_limit():
+    async def run():
+        registry = GameRegistry(1, 5, 2)
+        assert await registry.add(1, 100, Game()) == ""
+        assert await registry.add(2, 200, Game()) == ""
+        assert await registry.get_rejection_reason(3, 300)
+        assert await registry.add(3, 300, Game())
+        assert registry.count() == 2
+
+    asyncio.run(run())
+
+
+def test_remove_keeps_counts_right():
+    async def run():
+        registry = GameRegistry(2, 5, 10)
+        first, second, third = Game(), Game(), Game()
+        for channel_id, game in ((1, first), (1, second), (2, third)):
+            assert await registry.add(channel_id, 100, game) == ""
+        assert await registry.stats() == {'games': 3, 'channels': 2, 'guilds': 1, 'all_processes': 3}
+
+        await registry.remove(1, 100, first)
+        await registry.remove(1, 100, first)
+        assert await registry.stats() == {'games': 2, 'channels': 2, 'guilds': 1, 'all_processes': 2}
+        await registry.remove(1, 100, second)
+        await registry.remove(2, 100, third)
+        assert await registry.stats() == {'games': 0, 'channels': 0, 'guilds': 0, 'all_processes': 0}
+        assert not registry.games and not registry.guilds
+
+    asyncio.run(run())
+
+
+def test_shared_store_refuses_games_over_the_total(tmp_path):
+    path = str(tmp_path / "shared.sqlite")
+    store, other = SharedGameStore(path), SharedGameStore(path)
+    assert store.try_add(1, 100, 2)
+    assert other.try_add(2, 200, 2)
+    assert not store.try_add(3, 300, 2)
+    assert store.count() == other.count() == 2
+    other.remove(2)
+    assert store.try_add(3, 300, 2)
+
+
+def test_registries_share_the_total_through_the_store(tmp_path):
+    async def run():
+        path = str(tmp_path / "shared.sqlite")
+        registries = [GameRegistry(1, 5, 3, SharedGameStore(path)) for _ in range(2)]
+        reasons = await asyncio.gather(*[registries[i % 2].add(i, i, Game()) for i in range(6)])
+        assert sum(1 for reason in reasons if not reason) == 3
+        assert sum(registry.count() for registry in registries) == 3
+        assert (await registries[0].stats())['all_processes'] == 3
+
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import kana_conversion
+from game_state import GameState
+from team import Team
+
+
+class User:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+def game_after(kata: str) -> GameState:
+    game_state = GameState([Team([User(1)]), Team([User(2)])])
+    game_state.set_previous_word(kata, kata)
+    return game_state
+
+
+@pytest.mark.parametrize("previous, current, follows", [
+    ("シリトリ", "リンゴ", True),
+    ("シリトリ", "トリアエズ", True),
+    ("シリトリ", "ゴリラ", False),
+    ("キシャ", "シャシン", True),
+    ("キシャ", "ヤマ", True),
+    ("キシャ", "シカ", False),
+    ("コーヒー", "イス", True),
+    ("ハナヂ", "ジカン", True),
+    ("スイカ", "ガッコウ", False),
+])
+def test_follows_previous_word(previous, current, follows):
+    assert game_after(previous).follows_previous_word(current) is follows
+
+
+def test_follows_previous_word_agrees_with_match_kana():
+    alphabet = sorted(kana_conversion.set_kata | {'ー', 'ヂ', 'ヅ'})
+    rng = random.Random(0)
+    for _ in range(20000):
+        previous = ''.join(rng.choices(alphabet, k=rng.randint(2, 5)))
+        current = ''.join(rng.choices(alphabet, k=rng.randint(2, 5)))
+        assert (game_after(previous).follows_previous_word(current)
+                == kana_conversion.match_kana(previous, current)), (previous, current)
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import dictionary
+import game_turns
+import kana_conversion
+from game_state import GameState
+from team import Team
+
+
+class User:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class Channel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.sent.append(content)
+
+
+class Interaction:
+    def __init__(self):
+        self.channel = Channel()
+
+
+class RemoteDictionary(dictionary.DictionaryBackend):
+    """
+    Dictionary searched as if over the network, recording the terms searched.
+    """
+
+    def __init__(self, readings: list[str]):
+        self.readings = readings
+        self.terms = []
+
+    def search(self, term: str) -> dict:
+        self.terms.append(term)
+        prefix = term[:-1] if term.endswith('*') else None
+        return {r: [{'word': None, 'meanings': [r], 'reading': r}] for r in self.readings
+                if (r.startswith(prefix) if prefix is not None else r == term)}
+
+    def is_remote(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def local_backend(local_dictionary, monkeypatch):
+    monkeypatch.setattr(kana_conversion, "dictionary_backend", local_dictionary)
+    kana_conversion.lookup_cache.clear()
+    yield local_dictionary
+    kana_conversion.lookup_cache.clear()
+
+
+@pytest.mark.parametrize("response", ["ぶどう", "ブドウ", "ぶどー", "ブドー"])
+def test_kana_spellings_find_the_dictionary_reading(local_backend, response):
+    inter = Interaction()
+    game_state = GameState([Team([User(1)]), Team([User(2)])])
+    kata, kanji = asyncio.run(game_turns.process_player_kana(inter, response, game_state))
+    assert kata == kana_conversion.hiragana_to_katakana(response)
+    assert kanji == "葡萄"
+    assert "grape" in inter.channel.sent[0]
+
+
+def test_unknown_kana_loses_a_life(local_backend):
+    inter = Interaction()
+    game_state = GameState([Team([User(1)]), Team([User(2)])])
+    assert asyncio.run(game_turns.process_player_kana(inter, "ぶどうしゅ", game_state)) == ("", "")
+    assert game_state.lives[1] == 2
+
+
+def test_prefetch_fetches_the_moras_the_bot_looks_up(monkeypatch):
+    backend = RemoteDictionary(["きしゃ", "きのこ"])
+    monkeypatch.setattr(kana_conversion, "dictionary_backend", backend)
+    kana_conversion.lookup_cache.clear()
+    player, bot = User(1), User(2)
+    game_state = GameState([Team([player]), Team([bot])])
+    game_state.set_previous_word("ダイキ", "")
+    asyncio.run(game_turns.prefetch_next_turn(game_state, bot))
+    kana_conversion.lookup_cache.clear()
+    assert {"や*", "ヤ*", "こ*", "コ*"} <= set(backend.terms)
+    assert "しゃ*" not in backend.terms
@@ -0,0 +1,26 @@
+import kana_conversion
+
+
+def count_splits(kata: str) -> int:
+    return kata.count('ン')
+
+
+def test_parsings_are_ordered_by_number_of_splits():
+    parsings = [kata for kata, _ in kana_conversion.iter_romaji_katakana('kaninanu')]
+    assert parsings[0] == 'カニナヌ'
+    assert len(parsings) == len(set(parsings)) == 8
+    assert [count_splits(kata) for kata in parsings] == sorted(count_splits(kata) for kata in parsings)
+
+
+def test_capped_parsings_keep_every_split_position():
+    parsings, _ = kana_conversion.romaji_to_katakana('na' * 10)
+    assert len(parsings) == kana_conversion.MAX_ROMAJI_VARIANTS
+    assert parsings[0] == 'ナ' * 10
+    # Every parsing with one split is kept before any with two, including splits at the start of the word
+    assert {kata.index('ン') for kata in parsings[1:11]} == set(range(10))
+    assert {count_splits(kata) for kata in parsings[11:]} == {2}
+
+
+def test_prefix_filter_prunes_splits():
+    parsings = [kata for kata, _ in kana_conversion.iter_romaji_katakana('kaninanu', lambda kata: kata != 'カンイ')]
+    assert parsings == ['カニナヌ', 'カニナンウ', 'カニンアヌ', 'カニンアンウ']
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from lookup_cache import LookupCache
+
+
+class Fetcher:
+    """
+    Fetch function counting its calls, which can be made to wait until released.
+    """
+
+    def __init__(self, value: dict = None, error: Exception = None):
+        self.value = {'word': 1} if value is None else value
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def test_hit_after_miss():
+    async def run():
+        cache = LookupCache(10, 60, 60)
+        fetch = Fetcher()
+        assert await cache.get("a", fetch) == fetch.value
+        assert await cache.get("a", fetch) == fetch.value
+        assert fetch.calls == 1
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    asyncio.run(run())
+
+
+def test_expired_entries_are_fetched_again():
+    async def run():
+        cache = LookupCache(10, 60, 0)
+        found, empty = Fetcher(), Fetcher(value={})
+        await cache.get("found", found)
+        await cache.get("empty", empty)
+        await cache.get("found", found)
+        await cache.get("empty", empty)
+        assert found.calls == 1
+        assert empty.calls == 2
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def run():
+        cache = LookupCache(2, 60, 60)
+        fetches = {key: Fetcher() for key in "abc"}
+        await cache.get("a", fetches["a"])
+        await cache.get("b", fetches["b"])
+        await cache.get("a", fetches["a"])
+        await cache.get("c", fetches["c"])
+        assert list(cache.entries) == ["a", "c"]
+        assert cache.stats()['evictions'] == 1
+
+    asyncio.run(run())
+
+
+def test_concurrent_lookups_share_one_fetch():
+    async def run():
+        cache = LookupCache(10, 60, 60)
+        fetch = Fetcher()
+        fetch.release.clear()
+        waiters = [asyncio.create_task(cache.get("a", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        assert await asyncio.gather(*waiters) == [fetch.value] * 5
+        assert fetch.calls == 1
+        assert cache.stats()['coalesced'] == 4
+        assert not cache.in_flight
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def run():
+        cache = LookupCache(10, 60, 60)
+        fetch = Fetcher(error=ValueError("offline"))
+        fetch.release.clear()
+        waiters = [asyncio.create_task(cache.get("a", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert "a" not in cache.entries and not cache.in_flight
+
+        fetch.error = None
+        assert await cache.get("a", fetch) == fetch.value
+        assert fetch.calls == 2
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_does_not_cancel_other_waiters():
+    async def run():
+        cache = LookupCache(10, 60, 60)
+        fetch = Fetcher()
+        fetch.release.clear()
+        leader = asyncio.create_task(cache.get("a", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get("a", fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        fetch.release.set()
+        assert await follower == fetch.value
+        assert fetch.calls == 1
+        assert cache.entries["a"][1] == fetch.value
+
+    asyncio.run(run())
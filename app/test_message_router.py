@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from constants import MESSAGE_BEGIN
+from message_router import MessageRouter
+
+
+class Object:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def message(channel_id: int, author_id: int, content: str = "しりとり") -> Object:
+    return Object(channel=Object(id=channel_id), author=Object(id=author_id), content=content)
+
+
+def accept(msg) -> bool:
+    return True
+
+
+def chat_mode(msg) -> bool:
+    return msg.content[0:2] in MESSAGE_BEGIN
+
+
+def test_messages_are_routed_by_channel_and_author():
+    async def run():
+        router = MessageRouter()
+        waiter = asyncio.create_task(router.wait_for(1, {10, 11}, accept, 1))
+        await asyncio.sleep(0)
+        assert not router.dispatch(message(2, 10))
+        assert not router.dispatch(message(1, 12))
+        expected = message(1, 11)
+        assert router.dispatch(expected)
+        assert await waiter is expected
+        assert len(router) == 0 and not router.waiters
+
+    asyncio.run(run())
+
+
+def test_check_filters_chat_mode_messages():
+    async def run():
+        router = MessageRouter()
+        waiter = asyncio.create_task(router.wait_for(1, {10}, chat_mode, 1))
+        await asyncio.sleep(0)
+        assert not router.dispatch(message(1, 10, "just chatting"))
+        expected = message(1, 10, "> しりとり")
+        assert router.dispatch(expected)
+        assert await waiter is expected
+
+    asyncio.run(run())
+
+
+def test_timeout_removes_the_waiter():
+    async def run():
+        router = MessageRouter()
+        with pytest.raises(asyncio.TimeoutError):
+            await router.wait_for(1, {10, 11}, accept, 0.01)
+        assert len(router) == 0 and not router.waiters
+        assert not router.dispatch(message(1, 10))
+
+    asyncio.run(run())
+
+
+def test_one_message_reaches_one_waiter():
+    async def run():
+        router = MessageRouter()
+        first = asyncio.create_task(router.wait_for(1, {10}, accept, 1))
+        second = asyncio.create_task(router.wait_for(1, {10}, accept, 1))
+        await asyncio.sleep(0)
+        assert len(router) == 2
+        first_message, second_message = message(1, 10), message(1, 10)
+        assert router.dispatch(first_message)
+        assert await first is first_message
+        await asyncio.sleep(0)
+        assert not second.done()
+        assert router.dispatch(second_message)
+        assert await second is second_message
+
+    asyncio.run(run())
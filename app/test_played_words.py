@@ -0,0 +1,26 @@
+import played_words
+from played_words import PlayedWords
+
+
+def test_words_are_kept_in_order_without_repeats():
+    played = PlayedWords(["シリトリ", "リンゴ"])
+    played.add("ゴリラ")
+    played.add("リンゴ")
+    assert list(played) == ["シリトリ", "リンゴ", "ゴリラ"]
+    assert len(played) == 3
+    assert list(played.since(1)) == ["リンゴ", "ゴリラ"]
+
+
+def test_contains_only_words_of_the_game():
+    played = PlayedWords(["シリトリ"])
+    PlayedWords(["ラッパ"])
+    assert "シリトリ" in played
+    assert "ラッパ" not in played
+    assert "パンダ" not in played
+
+
+def test_games_share_word_ids():
+    first = PlayedWords(["スイカ"])
+    second = PlayedWords(["スイカ"])
+    assert first.ids == second.ids == {played_words.word_ids["スイカ"]}
+    assert played_words.words[played_words.word_ids["スイカ"]] == "スイカ"